@@ -0,0 +1,72 @@
+"""
+Atomic file writes shared by the pipeline modules.
+
+Every file the pipeline writes (the GeoJSON, downloads, published data,
+the time-series store, the crosswalk and the run report) is written to a
+temporary file in the same directory and renamed over the target only once
+it is complete, so a reader or a crashed run never sees half a file. The
+target keeps its permission bits; a new file gets the umask default, as
+it would from open().
+
+    with atomic.open_atomic(path, 'wb') as file:
+        file.write(data)
+    atomic.write_json(data, path, indent=2)
+"""
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+TMP_PREFIX = '.tmp-'
+
+
+def _read_umask():
+    # os.umask() can only be read by setting it, which is process-wide; do
+    # that once here, before any download thread writes files
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+UMASK = _read_umask()
+
+
+def file_mode(path):
+    """
+    Return the permission bits of path, or the default for a new file under
+    the umask the process started with when it does not exist yet.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+@contextmanager
+def open_atomic(path, mode='w', encoding='utf-8'):
+    """
+    Open a temporary file next to path for writing and rename it over path
+    when the block finishes. The temporary file is removed if it raises.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding) as file:
+            yield file
+        # mkstemp creates the file 0600
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_bytes(data, path):
+    with open_atomic(path, 'wb') as file:
+        file.write(data)
+
+
+def write_json(data, path, **dump_kwargs):
+    with open_atomic(path, 'w') as file:
+        json.dump(data, file, **dump_kwargs)
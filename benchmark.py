@@ -0,0 +1,347 @@
+"""
+Benchmark every pipeline stage on synthetic fixtures at a configurable scale.
+
+Generates a GeoJSON of square "counties", wide Zillow home and rent CSVs,
+a UTF-16 inventory TSV and a census P9 CSV with matching ids, then runs
+each registered stage (plus loading the GeoJSON, building the crosswalk,
+classifying, publishing the compact geometry and attribute table, cutting
+the tile pyramid and writing the full GeoJSON) and records its wall time
+and peak traced memory.
+
+    python benchmark.py                           # national scale, ~3,100 counties
+    python benchmark.py --scale tract             # ~85,000 units
+    python benchmark.py --units 20000 --months 600
+    python benchmark.py --compare benchmarks/previous.json
+
+Every run is saved as JSON under benchmarks/ (one file per run, named by
+scale and time), and --compare prints the ratio to an earlier result so
+regressions stand out.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+import atomic
+import classify
+import crosswalk
+import fetch
+import pipeline
+import publish
+import stages
+import tiles
+
+RESULTS_DIR = 'benchmarks'
+
+# Number of mapped units and months of history for the preset scales
+SCALES = {
+    'national': (3143, 300),
+    'tract': (85000, 300),
+}
+
+# Counties per synthetic state; state s holds FIPS s*1000+1 ... s*1000+COUNTIES_PER_STATE
+COUNTIES_PER_STATE = 999
+
+TODAY = date(2024, 6, 20)
+
+
+def state_code(state):
+    """
+    Return a two letter code for a synthetic state number.
+    """
+    return chr(ord('A') + state // 26 % 26) + chr(ord('A') + state % 26)
+
+
+def synthetic_units(units):
+    """
+    Return (state, county, name) arrays for 'units' synthetic counties.
+    """
+    index = np.arange(units)
+    state = index // COUNTIES_PER_STATE + 1
+    county = index % COUNTIES_PER_STATE + 1
+    names = [f"Unit {c}, {state_code(s)}" for s, c in zip(state.tolist(), county.tolist())]
+    return state, county, names
+
+
+def write_geojson(path, state, county, names):
+    """
+    Write one unit square per county, laid out on a grid, with the
+    properties the real basemap carries.
+    """
+    side = int(np.ceil(np.sqrt(len(names))))
+    features = []
+    for i, (s, c, name) in enumerate(zip(state.tolist(), county.tolist(), names)):
+        x, y = -125 + (i % side) * 0.1, 25 + (i // side) * 0.1
+        fips = f"{s:02d}{c:03d}"
+        features.append({
+            'type': 'Feature',
+            'properties': {'CountyNamesBase_NAMECOUNTY': name, 'LSAD': 'County',
+                           'id': fips, 'GEO_ID': f"0500000US{fips}"},
+            'geometry': {'type': 'Polygon',
+                         'coordinates': [[[x, y], [x + 0.1, y], [x + 0.1, y + 0.1], [x, y + 0.1], [x, y]]]},
+        })
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, file)
+
+
+def month_ends(months):
+    """
+    Return the last 'months' month-end dates up to the month TODAY reads.
+    """
+    periods = pd.period_range(end=pd.Period(stages.target_month(TODAY), freq='M'), periods=months, freq='M')
+    return [period.end_time.date() for period in periods]
+
+
+def random_walk(rng, units, months, start):
+    """
+    Return a units x months array of positive prices, with ~2% missing.
+    """
+    steps = rng.normal(1.003, 0.01, size=(units, months))
+    values = start * rng.uniform(0.5, 2.0, size=(units, 1)) * np.cumprod(steps, axis=1)
+    values[rng.random(values.shape) < 0.02] = np.nan
+    return np.round(values)
+
+
+def write_zillow(path, rng, state, county, names, months, start):
+    """
+    Write a wide Zillow county CSV with one column per month end.
+    """
+    columns = [day.strftime('%Y-%m-%d') for day in month_ends(months)]
+    df = pd.DataFrame(random_walk(rng, len(names), months, start), columns=columns)
+    df.insert(0, 'RegionID', np.arange(len(names)))
+    df.insert(1, 'SizeRank', np.arange(len(names)))
+    df.insert(2, 'RegionName', [name.split(', ')[0] + ' County' for name in names])
+    df.insert(3, 'RegionType', 'county')
+    df.insert(4, 'StateName', [name.split(', ')[1] for name in names])
+    df.insert(5, 'State', df['StateName'])
+    df.insert(6, 'Metro', '')
+    df.insert(7, 'StateCodeFIPS', state)
+    df.insert(8, 'MunicipalCodeFIPS', county)
+    df.to_csv(path, index=False)
+
+
+def write_inventory(path, rng, names, months):
+    """
+    Write a UTF-16 inventory TSV with 'March 2024' style month columns and
+    thousands separators, like the Realtor.com export.
+    """
+    columns = [day.strftime('%B %Y') for day in month_ends(months)]
+    values = random_walk(rng, len(names), months, 800)
+    df = pd.DataFrame({column: [None if np.isnan(v) else f"{int(v):,}" for v in values[:, i]]
+                       for i, column in enumerate(columns)})
+    # Names as 'Unit 1 County, AA'; a few are mangled to exercise the fuzzy matching
+    regions = [name.replace(', ', ' County, ') for name in names]
+    for i in range(0, len(regions), 500):
+        regions[i] = regions[i].replace('Unit', 'Unitt')
+    df.insert(0, 'Region', regions)
+    df.to_csv(path, sep='\t', encoding='utf-16', index=False)
+
+
+def write_p9(path, rng, state, county):
+    """
+    Write a census P9 data CSV (with the repeated label row) and its column
+    metadata file.
+    """
+    columns = [f"P9_{i:03d}N" for i in range(1, 12)]
+    counts = rng.integers(0, 5000, size=(len(state), len(columns) - 1))
+    total = counts.sum(axis=1, keepdims=True)
+    df = pd.DataFrame(np.hstack([total, counts]), columns=columns)
+    df.insert(0, 'GEO_ID', [f"0500000US{s:02d}{c:03d}" for s, c in zip(state.tolist(), county.tolist())])
+    df.insert(1, 'NAME', df['GEO_ID'])
+
+    labels = ['Geography', 'Geographic Area Name'] + [f" !!Total:!!Group {column}" for column in columns]
+    label_row = pd.DataFrame([labels], columns=df.columns)
+    pd.concat([label_row, df.astype(str)]).to_csv(path, index=False)
+    pd.DataFrame({'Column Name': df.columns, 'Label': labels}).to_csv(stages.metadata_path(path), index=False)
+
+
+def make_fixtures(fixture_dir, units, months, seed=0):
+    """
+    Generate every input file for 'units' counties and 'months' months of
+    history into fixture_dir. Returns the paths by name.
+    """
+    os.makedirs(fixture_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    state, county, names = synthetic_units(units)
+
+    paths = {
+        'geojson': os.path.join(fixture_dir, 'counties.geojson'),
+        'home_prices': os.path.join(fixture_dir, 'home_prices.csv'),
+        'rent_prices': os.path.join(fixture_dir, 'rent_prices.csv'),
+        'inventory': os.path.join(fixture_dir, 'inventory.csv'),
+        'demographics': os.path.join(fixture_dir, 'P9-Data.csv'),
+    }
+    write_geojson(paths['geojson'], state, county, names)
+    write_zillow(paths['home_prices'], rng, state, county, names, months, 250000)
+    write_zillow(paths['rent_prices'], rng, state, county, names, months, 1500)
+    write_inventory(paths['inventory'], rng, names, months)
+    write_p9(paths['demographics'], rng, state, county)
+    return paths
+
+
+def measure(func, trace_memory):
+    """
+    Call func() and return (result, seconds, peak traced bytes or None).
+    """
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_once(paths, work_dir, trace_memory):
+    """
+    Run every step once against a fresh copy of the fixtures, with a cold
+    parse cache. Returns {step: (seconds, peak bytes)} in run order.
+    """
+    cache_dir = os.path.join(work_dir, 'cache')
+    publish_dir = os.path.join(work_dir, 'data')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    shutil.rmtree(publish_dir, ignore_errors=True)
+
+    options = pipeline.default_options()
+    options.update({
+        'today': TODAY,
+        'inventory_path': paths['inventory'],
+        'demographics_path': paths['demographics'],
+        'cache_dir': cache_dir,
+        'publish_dir': publish_dir,
+        'downloads': None,
+        # The Zillow stages read the local fixtures instead of downloading
+        'fetched': {name: fetch.FetchResult(paths[name], True) for name in stages.SOURCES},
+    })
+
+    steps = {}
+
+    def step(name, func):
+        result, seconds, peak = measure(func, trace_memory)
+        steps[name] = (seconds, peak)
+        return result
+
+    geojson_data = step('load_geojson', lambda: pipeline.load_geojson(paths['geojson']))
+    options['crosswalk'] = step('crosswalk', lambda: crosswalk.load(geojson_data, cache_dir))
+
+    for registered in stages.STAGES.values():
+        if registered.parallel:
+            step(registered.name, lambda: stages.merge_table(geojson_data, registered.func(options)))
+        else:
+            step(registered.name, lambda: registered.func(geojson_data, options))
+
+    classes = step('classify', lambda: classify.classify(geojson_data))
+
+    # Cold publish: no earlier geometry to reuse, tiles timed on their own
+    step('publish', lambda: publish.publish(geojson_data, pipeline.output_properties(), publish_dir,
+                                            classes=classes))
+
+    def cut_tiles():
+        geometry, _ = publish.split_snapshot(geojson_data, pipeline.output_properties())
+        return tiles.write_tiles(geometry, publish_dir, tiles.pyramid_name('benchmark'))
+    step('tiles', cut_tiles)
+
+    # Only written with --write-geojson
+    out_path = os.path.join(work_dir, 'out.geojson')
+    step('write_geojson', lambda: atomic.write_json(geojson_data, out_path, ensure_ascii=False, indent=2))
+    return steps
+
+
+def benchmark(units, months, repeat=3, fixture_dir=None, seed=0):
+    """
+    Generate fixtures and run every step 'repeat' times for timing plus once
+    under tracemalloc for peak memory. Returns the result document.
+    """
+    with tempfile.TemporaryDirectory(prefix='bench-') as work_dir:
+        fixture_dir = fixture_dir or os.path.join(work_dir, 'fixtures')
+        logging.info("Generating fixtures: %d units x %d months", units, months)
+        paths = make_fixtures(fixture_dir, units, months, seed)
+        sizes = {name: os.path.getsize(path) for name, path in paths.items()}
+
+        timings = [run_once(paths, work_dir, trace_memory=False) for _ in range(repeat)]
+        memory = run_once(paths, work_dir, trace_memory=True)
+
+    results = {}
+    for name in timings[0]:
+        seconds = [timing[name][0] for timing in timings]
+        results[name] = {
+            'seconds_min': min(seconds),
+            'seconds_median': statistics.median(seconds),
+            'peak_bytes': memory[name][1],
+        }
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'units': units,
+        'months': months,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'fixture_bytes': sizes,
+        'stages': results,
+    }
+
+
+def print_report(document, previous=None):
+    """
+    Print one line per step, with the ratio to 'previous' when given.
+    """
+    print(f"{document['units']} units x {document['months']} months, best of {document['repeat']}")
+    print(f"{'step':<16}{'seconds':>10}{'peak MiB':>10}" + (f"{'vs prev':>10}" if previous else ''))
+    for name, result in document['stages'].items():
+        line = f"{name:<16}{result['seconds_min']:>10.3f}{result['peak_bytes'] / 2 ** 20:>10.1f}"
+        before = (previous or {}).get('stages', {}).get(name)
+        if before and before['seconds_min'] > 0:
+            line += f"{result['seconds_min'] / before['seconds_min']:>9.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='national', help="preset size (default: national)")
+    parser.add_argument('--units', type=int, help="number of counties/tracts, overrides --scale")
+    parser.add_argument('--months', type=int, help="months of history in the wide files, overrides --scale")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per step (default: 3)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the fixtures")
+    parser.add_argument('--fixtures', help="keep the generated fixtures in this directory")
+    parser.add_argument('--output', help=f"result file (default: {RESULTS_DIR}/<units>x<months>-<time>.json)")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    units, months = SCALES[args.scale]
+    units = args.units or units
+    months = args.months or months
+
+    document = benchmark(units, months, repeat=args.repeat, fixture_dir=args.fixtures, seed=args.seed)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{units}x{months}-{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    atomic.write_json(document, output, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            previous = json.load(file)
+    print_report(document, previous)
+    print(f"Saved {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Cache of parsed source tables, keyed by a hash of the source file.
+
+Parsing inventory.csv (UTF-16 TSV), the wide Zillow CSVs and the census
+P9 CSV dominates a refresh. read_table() parses a file once, stores the typed DataFrame in a columnar format and, while the
+source bytes stay the same, loads only the requested columns from there.
+
+Entries are stored as Feather when pyarrow is installed and otherwise as
+one memory-mapped .npy file per column. Old entries are evicted by age and
+total size after every store.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 (only needed for Feather support in pandas)
+except ImportError:
+    pyarrow = None
+
+import atomic
+
+CACHE_DIR = '.pipeline-cache'
+
+# <kind>-<sha256 of the source file>, see entry_path()
+ENTRY_NAME = re.compile(r'^[\w.-]+-[0-9a-f]{64}$')
+
+# Eviction limits
+MAX_BYTES = 512 * 1024 * 1024
+MAX_AGE_DAYS = 90
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Return the SHA-256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def entry_path(cache_dir, path, kind):
+    """
+    Return the cache entry location for a source file parsed by 'kind'.
+    """
+    return os.path.join(cache_dir, f"{kind}-{file_hash(path)}")
+
+
+def _store_numpy(df, entry):
+    os.makedirs(entry)
+    columns = []
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if values.dtype == object or isinstance(values.dtype, pd.StringDtype):
+            # Strings go in a fixed-width array with a separate null mask
+            missing = values.isna().to_numpy()
+            np.save(os.path.join(entry, f"{i}.mask.npy"), missing)
+            values = values.where(~missing, '').astype(str).to_numpy(dtype=str)
+            kind = 'str'
+        else:
+            values = values.to_numpy()
+            kind = 'num'
+        np.save(os.path.join(entry, f"{i}.npy"), values, allow_pickle=False)
+        columns.append({'name': column, 'file': i, 'kind': kind})
+
+    with open(os.path.join(entry, 'columns.json'), 'w', encoding='utf-8') as file:
+        json.dump(columns, file)
+
+
+def _load_numpy(entry, columns=None):
+    with open(os.path.join(entry, 'columns.json'), 'r', encoding='utf-8') as file:
+        stored = json.load(file)
+    if columns is not None:
+        by_name = {column['name']: column for column in stored}
+        stored = [by_name[name] for name in columns]
+
+    data = {}
+    for column in stored:
+        values = np.load(os.path.join(entry, f"{column['file']}.npy"), mmap_mode='r', allow_pickle=False)
+        if column['kind'] == 'str':
+            missing = np.load(os.path.join(entry, f"{column['file']}.mask.npy"))
+            values = pd.Series(values.astype(object)).where(~missing, None)
+        data[column['name']] = values
+    return pd.DataFrame(data)
+
+
+def store(df, entry):
+    """
+    Write a DataFrame to a cache entry (Feather file or .npy directory).
+    """
+    df = df.reset_index(drop=True)
+    df.columns = [str(column) for column in df.columns]
+    if pyarrow is not None:
+        with atomic.open_atomic(entry, 'wb') as file:
+            df.to_feather(file)
+        return
+
+    tmp_entry = f"{entry}.tmp-{os.getpid()}"
+    _store_numpy(df, tmp_entry)
+    try:
+        os.replace(tmp_entry, entry)
+    except OSError:
+        # A directory cannot replace a non-empty one: another process stored
+        # the same file first, and its entry holds the same table
+        if not os.path.isdir(entry):
+            raise
+        shutil.rmtree(tmp_entry)
+
+
+def load(entry, columns=None):
+    """
+    Read a cache entry, limited to 'columns' when given.
+    """
+    if os.path.isdir(entry):
+        return _load_numpy(entry, columns)
+    return pd.read_feather(entry, columns=columns)
+
+
+def ensure_entry(path, reader, kind, cache_dir=CACHE_DIR):
+    """
+    Return the cache entry for reader(path), parsing and storing it first
+    when the file has not been seen before.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = entry_path(cache_dir, path, kind)
+
+    if not os.path.exists(entry):
+        logging.info("Parsing %s", path)
+        store(reader(path), entry)
+        evict(cache_dir)
+    else:
+        # Touch the entry so eviction drops the least recently used ones
+        os.utime(entry)
+    return entry
+
+
+def entry_columns(entry):
+    """
+    Return the column names stored in a cache entry without loading any data.
+    """
+    if os.path.isdir(entry):
+        with open(os.path.join(entry, 'columns.json'), 'r', encoding='utf-8') as file:
+            return [column['name'] for column in json.load(file)]
+    import pyarrow.ipc
+    with pyarrow.ipc.open_file(entry) as table:
+        return table.schema.names
+
+
+def read_table(path, reader, kind, columns=None, cache_dir=CACHE_DIR):
+    """
+    Return reader(path) as a DataFrame, from the cache when the file has
+    not changed since it was last parsed.
+
+    'kind' names the reader and is part of the cache key, so bump it when
+    the parsing changes. 'columns' limits what is loaded from the cache.
+    """
+    return load(ensure_entry(path, reader, kind, cache_dir), columns)
+
+
+def entry_size(entry):
+    if os.path.isdir(entry):
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+    return os.path.getsize(entry)
+
+
+def remove_entry(entry):
+    if os.path.isdir(entry):
+        shutil.rmtree(entry)
+    else:
+        os.remove(entry)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, max_age_days=MAX_AGE_DAYS):
+    """
+    Remove entries not used for max_age_days, then the least recently used
+    ones until the cache fits in max_bytes.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        # Only parsed tables; not crosswalk.json or another process's temporary files
+        if not ENTRY_NAME.match(name):
+            continue
+        entry = os.path.join(cache_dir, name)
+        try:
+            entries.append((os.path.getmtime(entry), entry_size(entry), entry))
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            continue
+    entries.sort()
+
+    cutoff = time.time() - max_age_days * 86400
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, entry in entries:
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        logging.info("Evicting cache entry %s", os.path.basename(entry))
+        try:
+            remove_entry(entry)
+        except FileNotFoundError:
+            pass
+        total -= size
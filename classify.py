@@ -0,0 +1,189 @@
+"""
+Derived metrics and choropleth classes, computed once per snapshot.
+
+After the stages have run, every feature gets rentalYield (a year of rent as
+a percentage of the home price) and, for every mapped metric, a
+'<metric>_class' property holding its class index (0 = lowest). The class
+breaks go to data/classes.json:
+
+    {"HomePrices": {"method": "quantile", "breaks": [30100, 112000, ..., 1850000],
+                    "counts": [443, 443, ...], "nulls": 87}, ...}
+
+Class i holds the values from breaks[i] up to breaks[i + 1]. The page
+colours a county by its class index and draws the legend from the breaks,
+instead of classifying raw values on every re-style. Breaks depend only on
+the data (quantiles, or Fisher-Jenks natural breaks on evenly spaced order
+statistics) and are rounded to three significant digits, so the same data
+always gives the same classes.
+"""
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from joins import to_json_values, write_properties
+
+CLASSES = 7
+METHODS = ('quantile', 'jenks')
+
+# Jenks runs on at most this many evenly spaced order statistics
+JENKS_SAMPLE = 1000
+
+# A mapped metric: its property, the dict property it is nested in (or None)
+# and the default way to break it
+Classified = namedtuple('Classified', ['property', 'nest', 'method'])
+
+CLASSIFIED = [
+    Classified('HomePrices', None, 'quantile'),
+    Classified('RentPrices', None, 'quantile'),
+    Classified('rentalYield', None, 'quantile'),
+    Classified('homegrowthYoY', None, 'jenks'),
+    Classified('homegrowthMoM', None, 'jenks'),
+    Classified('rentgrowthYoY', None, 'jenks'),
+    Classified('rentgrowthMoM', None, 'jenks'),
+    Classified('HousingInventory', None, 'jenks'),
+    Classified('medianincome_MedianIncome', None, 'quantile'),
+    Classified('unemploymentrate_Uemployment', None, 'quantile'),
+    Classified('white_percentage', 'demographics', 'quantile'),
+]
+
+
+def output_properties():
+    """
+    Return every property classify() writes onto the features.
+    """
+    return ['rentalYield'] + [f"{metric.property}_class" for metric in CLASSIFIED]
+
+
+def column(geojson_data, name, nest=None):
+    """
+    Return one numeric property of every feature as a float array (NaN for
+    null, missing or non-numeric values).
+    """
+    values = []
+    for feature in geojson_data['features']:
+        properties = feature['properties']
+        if nest is not None:
+            properties = properties.get(nest) or {}
+        value = properties.get(name)
+        values.append(value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan)
+    return np.array(values, dtype=float)
+
+
+def rental_yield(home, rent):
+    """
+    Return twelve months of rent as a percentage of the home price (NaN
+    where either is missing or the price is not positive).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(home > 0, rent * 12 / home * 100, np.nan)
+
+
+def round_significant(values, digits=3):
+    """
+    Round every value to 'digits' significant digits.
+    """
+    values = np.asarray(values, dtype=float)
+    magnitude = np.floor(np.log10(np.abs(np.where(values == 0, 1, values))))
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+
+def quantile_breaks(values, classes):
+    """
+    Return [min, inner breaks..., max] splitting values into equal-count classes.
+    """
+    return np.quantile(values, np.linspace(0, 1, classes + 1))
+
+
+def jenks_breaks(values, classes, sample=JENKS_SAMPLE):
+    """
+    Return [min, inner breaks..., max] minimizing the squared deviation
+    within classes (Fisher-Jenks), on at most 'sample' order statistics.
+    """
+    x = np.sort(values)
+    if len(x) > sample:
+        x = x[np.linspace(0, len(x) - 1, sample).round().astype(int)]
+    n = len(x)
+    classes = min(classes, n)
+
+    # Squared deviation of x[j..i] for a vector of starts j, from cumulative sums
+    s1 = np.concatenate([[0.0], np.cumsum(x)])
+    s2 = np.concatenate([[0.0], np.cumsum(x * x)])
+
+    def deviation(j, i):
+        total = s1[i + 1] - s1[j]
+        return (s2[i + 1] - s2[j]) - total * total / (i + 1 - j)
+
+    # cost[m, i]: best deviation of x[0..i] in m + 1 classes; start[m, i]: where class m begins
+    cost = np.full((classes, n), np.inf)
+    start = np.zeros((classes, n), dtype=int)
+    cost[0] = deviation(np.zeros(n, dtype=int), np.arange(n))
+    for m in range(1, classes):
+        for i in range(m, n):
+            j = np.arange(m, i + 1)
+            total = cost[m - 1, j - 1] + deviation(j, i)
+            best = int(np.argmin(total))
+            cost[m, i] = total[best]
+            start[m, i] = j[best]
+
+    lower = []
+    i = n - 1
+    for m in range(classes - 1, 0, -1):
+        lower.append(x[start[m, i]])
+        i = start[m, i] - 1
+    return np.array([x[0]] + lower[::-1] + [x[-1]])
+
+
+def breaks_for(values, method, classes=CLASSES):
+    """
+    Return the rounded breaks for the non-null values: [min, inner..., max].
+    """
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return np.array([])
+    breaks = round_significant(quantile_breaks(values, classes) if method == 'quantile'
+                               else jenks_breaks(values, classes))
+    # Ties (e.g. many equal values) merge classes; an outlier class at the top may be a single value
+    inner = np.unique(breaks[1:-1])
+    inner = inner[(inner > breaks[0]) & (inner <= breaks[-1])]
+    return np.concatenate([breaks[:1], inner, breaks[-1:]])
+
+
+def class_index(values, breaks):
+    """
+    Return the class of every value (NaN stays NaN): the number of inner
+    breaks at or below it.
+    """
+    index = np.searchsorted(breaks[1:-1], values, side='right').astype(float)
+    index[np.isnan(values)] = np.nan
+    return index
+
+
+def classify(geojson_data, method=None, classes=CLASSES):
+    """
+    Add rentalYield and the '<metric>_class' properties to the features in
+    one pass and return the breaks per metric. 'method' overrides the
+    per-metric default for every metric.
+    """
+    columns = OrderedDict()
+    yields = rental_yield(column(geojson_data, 'HomePrices'), column(geojson_data, 'RentPrices'))
+    columns['rentalYield'] = to_json_values(yields, 2)
+
+    result = OrderedDict()
+    for metric in CLASSIFIED:
+        values = yields if metric.property == 'rentalYield' else column(geojson_data, metric.property, metric.nest)
+        metric_method = method or metric.method
+        breaks = breaks_for(values, metric_method, classes)
+        index = class_index(values, breaks) if len(breaks) else np.full(len(values), np.nan)
+        columns[f"{metric.property}_class"] = to_json_values(index, 0)
+
+        known = index[~np.isnan(index)].astype(int)
+        result[metric.property] = {
+            'method': metric_method,
+            'breaks': breaks.tolist(),
+            'counts': np.bincount(known, minlength=max(len(breaks) - 1, 0)).tolist(),
+            'nulls': int(np.isnan(values).sum()),
+        }
+
+    write_properties(geojson_data, columns)
+    return result
@@ -0,0 +1,328 @@
+"""
+Compact encodings for the published county geometry.
+
+The map file used to be written with indent=2 and full-precision floats.
+encode() produces minified output instead, in one of two formats:
+
+- 'geojson': coordinates rounded to a fixed number of decimals;
+- 'topojson': coordinates quantized to an integer grid, with every shared
+  county border stored once as an arc and delta-encoded.
+
+Both can be simplified with Douglas-Peucker. Simplification works on the
+shared arcs, with the junctions where three or more counties meet kept
+fixed, so neighbouring counties stay edge to edge (no gaps or slivers).
+"""
+import json
+import logging
+
+import numpy as np
+
+FORMATS = ('geojson', 'topojson')
+
+PRECISION = 5            # decimals for GeoJSON coordinates (~1 m)
+QUANTIZATION = 100000    # grid size per axis for TopoJSON
+
+COMPACT = (',', ':')
+
+
+def polygons_of(geometry):
+    """
+    Return a geometry's polygons as a list of lists of rings.
+    """
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError(f"Unsupported geometry type for the county map: {geometry['type']}")
+
+
+def clean_ring(ring):
+    """
+    Return a ring as an (n, 2) array without consecutive duplicate points,
+    closed, and with at least four points (else None).
+    """
+    points = np.asarray(ring, dtype=float)[:, :2]
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[keep]
+    if len(points) and np.any(points[0] != points[-1]):
+        points = np.vstack([points, points[:1]])
+    return points if len(points) >= 4 else None
+
+
+def map_rings(geometries, func):
+    """
+    Apply func to every ring of every geometry and return the new polygons
+    per geometry. Rings for which func returns None are dropped, and so are
+    polygons whose outer ring was dropped.
+    """
+    mapped = []
+    for geometry in geometries:
+        polygons = []
+        for polygon in polygons_of(geometry):
+            rings = [func(ring) for ring in polygon]
+            if rings and rings[0] is not None:
+                polygons.append([ring for ring in rings if ring is not None])
+        mapped.append(polygons)
+    return mapped
+
+
+def build_topology(polygons_per_geometry):
+    """
+    Cut rings into arcs at junctions and de-duplicate shared arcs.
+
+    Returns (arcs, references): a list of (n, 2) arrays, and per geometry a
+    list of polygons of rings of arc indexes, where ~i means arc i reversed.
+    """
+    # A point is a junction when it is seen with different neighbours in
+    # different rings, i.e. where a shared border starts or ends
+    neighbours = {}
+    junctions = set()
+    for polygons in polygons_per_geometry:
+        for polygon in polygons:
+            for ring in polygon:
+                points = [tuple(point) for point in ring[:-1].tolist()]
+                count = len(points)
+                for i, point in enumerate(points):
+                    pair = frozenset((points[i - 1], points[(i + 1) % count]))
+                    seen = neighbours.setdefault(point, pair)
+                    if seen != pair:
+                        junctions.add(point)
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(points):
+        key = tuple(points)
+        if key in arc_index:
+            return arc_index[key]
+        reverse_key = key[::-1]
+        if reverse_key in arc_index:
+            return ~arc_index[reverse_key]
+        arc_index[key] = len(arcs)
+        arcs.append(np.asarray(points, dtype=float))
+        return arc_index[key]
+
+    references = []
+    for polygons in polygons_per_geometry:
+        geometry_refs = []
+        for polygon in polygons:
+            polygon_refs = []
+            for ring in polygon:
+                points = [tuple(point) for point in ring[:-1].tolist()]
+                cuts = [i for i, point in enumerate(points) if point in junctions]
+                if not cuts:
+                    # A ring with no junctions is one closed arc; start it at
+                    # its smallest point so identical rings share it
+                    start = points.index(min(points))
+                    points = points[start:] + points[:start]
+                    polygon_refs.append([add_arc(points + points[:1])])
+                    continue
+
+                # Rotate the ring to start at a junction, then cut at each one
+                points = points[cuts[0]:] + points[:cuts[0]]
+                points.append(points[0])
+                cut_positions = [i - cuts[0] for i in cuts] + [len(points) - 1]
+                ring_refs = []
+                for start, end in zip(cut_positions, cut_positions[1:]):
+                    ring_refs.append(add_arc(points[start:end + 1]))
+                polygon_refs.append(ring_refs)
+            geometry_refs.append(polygon_refs)
+        references.append(geometry_refs)
+    return arcs, references
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Return a boolean mask of the points Douglas-Peucker keeps; the first
+    and last points are always kept.
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        inner = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def simplify_arc(points, tolerance):
+    if np.all(points[0] == points[-1]):
+        # Closed arc: simplify both halves so the ring keeps some area
+        middle = len(points) // 2
+        keep = np.concatenate([douglas_peucker(points[:middle + 1], tolerance)[:-1],
+                               douglas_peucker(points[middle:], tolerance)])
+        return points[keep] if keep.sum() >= 4 else points
+    return points[douglas_peucker(points, tolerance)]
+
+
+def arc_points(arcs, index):
+    return arcs[index] if index >= 0 else arcs[~index][::-1]
+
+
+def ring_length(arcs, ring_refs):
+    return sum(len(arc_points(arcs, index)) - 1 for index in ring_refs) + 1
+
+
+def simplify_arcs(arcs, references, tolerance):
+    """
+    Simplify every arc, restoring the original arcs of any ring that would
+    collapse below four points.
+    """
+    simplified = [simplify_arc(arc, tolerance) for arc in arcs]
+    for geometry_refs in references:
+        for polygon_refs in geometry_refs:
+            for ring_refs in polygon_refs:
+                if ring_length(simplified, ring_refs) < 4:
+                    for index in ring_refs:
+                        arc = index if index >= 0 else ~index
+                        simplified[arc] = arcs[arc]
+    return simplified
+
+
+def decode_ring(arcs, ring_refs):
+    parts = [arc_points(arcs, index) for index in ring_refs]
+    return np.vstack([parts[0]] + [part[1:] for part in parts[1:]])
+
+
+def as_geometry(polygons):
+    if len(polygons) == 1:
+        return {'type': 'Polygon', 'coordinates': polygons[0]}
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def to_geojson(geojson_data, precision=PRECISION, simplify=0.0):
+    """
+    Return a copy of the feature collection with coordinates rounded to
+    'precision' decimals and, with simplify > 0, simplified with that
+    tolerance in degrees.
+    """
+    features = geojson_data['features']
+    polygons = map_rings([feature['geometry'] for feature in features],
+                         lambda ring: clean_ring(np.round(np.asarray(ring, dtype=float)[:, :2], precision)))
+
+    if simplify > 0:
+        arcs, references = build_topology(polygons)
+        arcs = simplify_arcs(arcs, references, simplify)
+        polygons = [[[decode_ring(arcs, ring_refs) for ring_refs in polygon_refs]
+                     for polygon_refs in geometry_refs] for geometry_refs in references]
+
+    compact = []
+    for feature, geometry_polygons in zip(features, polygons):
+        coordinates = [[np.round(ring, precision).tolist() for ring in polygon] for polygon in geometry_polygons]
+        compact.append({'type': 'Feature', 'properties': feature['properties'], 'geometry': as_geometry(coordinates)})
+    return {'type': 'FeatureCollection', 'features': compact}
+
+
+def to_topojson(geojson_data, quantization=QUANTIZATION, simplify=0.0, object_name='counties'):
+    """
+    Return the feature collection as a quantized, delta-encoded TopoJSON
+    topology with shared borders stored once. 'simplify' is in degrees.
+    """
+    features = geojson_data['features']
+    geometries = [feature['geometry'] for feature in features]
+
+    all_points = np.vstack([np.asarray(ring, dtype=float)[:, :2]
+                            for geometry in geometries for polygon in polygons_of(geometry) for ring in polygon])
+    x0, y0 = all_points.min(axis=0)
+    x1, y1 = all_points.max(axis=0)
+    kx = (x1 - x0) / (quantization - 1) or 1.0
+    ky = (y1 - y0) / (quantization - 1) or 1.0
+    scale = np.array([kx, ky])
+    translate = np.array([x0, y0])
+
+    polygons = map_rings(geometries, lambda ring: clean_ring(
+        np.round((np.asarray(ring, dtype=float)[:, :2] - translate) / scale)))
+    arcs, references = build_topology(polygons)
+    if simplify > 0:
+        arcs = simplify_arcs(arcs, references, simplify / min(kx, ky))
+
+    topology_geometries = []
+    for feature, geometry_refs in zip(features, references):
+        if len(geometry_refs) == 1:
+            geometry = {'type': 'Polygon', 'arcs': geometry_refs[0]}
+        else:
+            geometry = {'type': 'MultiPolygon', 'arcs': geometry_refs}
+        geometry['properties'] = feature['properties']
+        topology_geometries.append(geometry)
+
+    encoded_arcs = []
+    for arc in arcs:
+        arc = arc.astype(np.int64)
+        encoded_arcs.append(np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist())
+
+    return {
+        'type': 'Topology',
+        'bbox': [x0, y0, x1, y1],
+        'transform': {'scale': [kx, ky], 'translate': [x0, y0]},
+        'objects': {object_name: {'type': 'GeometryCollection', 'geometries': topology_geometries}},
+        'arcs': encoded_arcs,
+    }
+
+
+def from_topojson(topology, object_name='counties'):
+    """
+    Decode a topology written by to_topojson() back into a feature collection.
+    """
+    scale = np.asarray(topology['transform']['scale'], dtype=float)
+    translate = np.asarray(topology['transform']['translate'], dtype=float)
+    arcs = [np.cumsum(np.asarray(arc, dtype=float), axis=0) * scale + translate for arc in topology['arcs']]
+
+    features = []
+    for geometry in topology['objects'][object_name]['geometries']:
+        geometry_refs = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+        coordinates = [[decode_ring(arcs, ring_refs).tolist() for ring_refs in polygon_refs]
+                       for polygon_refs in geometry_refs]
+        features.append({'type': 'Feature', 'properties': geometry.get('properties', {}),
+                         'geometry': as_geometry(coordinates)})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def encode(geojson_data, output_format='geojson', precision=PRECISION, quantization=QUANTIZATION, simplify=0.0,
+           report_sizes=False):
+    """
+    Return (bytes, report) for the compact encoding of a feature collection.
+
+    With report_sizes, the report also compares the size against the old
+    indented, full-precision GeoJSON output, which takes a second full
+    serialization of the input.
+    """
+    if output_format == 'geojson':
+        encoded = to_geojson(geojson_data, precision=precision, simplify=simplify)
+    elif output_format == 'topojson':
+        encoded = to_topojson(geojson_data, quantization=quantization, simplify=simplify)
+    else:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(FORMATS)}")
+
+    data = json.dumps(encoded, separators=COMPACT, ensure_ascii=False).encode('utf-8')
+    report = {
+        'format': output_format,
+        'precision': precision if output_format == 'geojson' else None,
+        'quantization': quantization if output_format == 'topojson' else None,
+        'simplify': simplify,
+        'bytes_after': len(data),
+    }
+    if not report_sizes:
+        logging.info("Compact %s: %d bytes", output_format, len(data))
+        return data, report
+
+    original_size = len(json.dumps(geojson_data, indent=2, ensure_ascii=False).encode('utf-8'))
+    report['bytes_before'] = original_size
+    report['ratio'] = round(len(data) / original_size, 4) if original_size else None
+    logging.info("Compact %s: %d -> %d bytes (%.1f%%)", output_format, original_size, len(data),
+                 100.0 * len(data) / original_size if original_size else 0.0)
+    return data, report
@@ -0,0 +1,180 @@
+"""
+Crosswalk from every county name variant and id format to an integer FIPS key.
+
+The sources identify counties in different ways:
+
+    inventory.csv     'Autauga County, AL'     (Region)
+    Zillow CSVs       1 / 1                    (StateCodeFIPS / MunicipalCodeFIPS)
+    census P9         '0500000US01001'         (GEO_ID)
+    GeoJSON           '01001', '0500000US01001', 'Autauga, AL' + 'County'
+
+All of them are turned into the integer 1001 (state FIPS * 1000 + county
+FIPS), so every join is an integer array lookup. Names are normalized
+first; names that still miss are fuzzy-matched against the counties of the
+same state and the result is remembered in crosswalk.json, so each odd
+spelling is only matched once.
+"""
+import difflib
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import atomic
+
+CROSSWALK_FILE = 'crosswalk.json'
+
+# Key for rows that could not be matched
+MISSING = -1
+
+FUZZY_CUTOFF = 0.9
+
+NON_WORD = re.compile(r"[^a-z0-9,]+")
+
+
+def normalize_name(name):
+    """
+    Normalize a 'County Name, ST' string for matching: lower case,
+    punctuation dropped, '&' -> 'and', 'saint' -> 'st', single spaces.
+    """
+    name = name.lower().replace('&', ' and ').replace("'", '').replace('.', '')
+    name = NON_WORD.sub(' ', name)
+    name = re.sub(r'\bsaint\b', 'st', name)
+    return re.sub(r'\s*,\s*', ', ', ' '.join(name.split()))
+
+
+def state_of(normalized):
+    return normalized.rsplit(', ', 1)[-1] if ', ' in normalized else ''
+
+
+def fips_from_ids(values):
+    """
+    Convert '01001', '1001', 1001 or '0500000US01001' style ids to integer
+    keys (MISSING where there are no digits).
+    """
+    digits = pd.Series(values, dtype=object).astype(str).str.extract(r'(?:US)?(\d+)$', expand=False)
+    return pd.to_numeric(digits, errors='coerce').fillna(MISSING).astype(np.int64).to_numpy()
+
+
+def fips_from_parts(state, county):
+    """
+    Combine state and county FIPS columns into integer keys.
+    """
+    state = pd.to_numeric(pd.Series(state), errors='coerce')
+    county = pd.to_numeric(pd.Series(county), errors='coerce')
+    return (state * 1000 + county).fillna(MISSING).astype(np.int64).to_numpy()
+
+
+def feature_name_variants(properties):
+    """
+    Return the names a feature may be listed under in other sources.
+    """
+    variants = []
+    if properties.get('CountyName'):
+        variants.append(properties['CountyName'])
+    base = properties.get('CountyNamesBase_NAMECOUNTY')
+    if base:
+        variants.append(base)
+        if properties.get('LSAD') and ', ' in base:
+            county_name, state = base.split(', ', 1)
+            variants.append(f"{county_name} {properties['LSAD']}, {state}")
+    return variants
+
+
+class Crosswalk:
+    """
+    Name and id index for one feature collection, with a persistent cache
+    of fuzzy name matches. Only the fuzzy matches are saved: the name index
+    is rebuilt from the features every run, so it follows their changes.
+    """
+
+    def __init__(self, names=None, fuzzy=None):
+        self.names = names or {}
+        self.fuzzy = fuzzy or {}
+        self.report = {}
+
+    @classmethod
+    def from_features(cls, geojson_data, path=None):
+        """
+        Build the crosswalk for the features, reusing fuzzy matches saved at path.
+        """
+        fuzzy = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                fuzzy = json.load(file).get('fuzzy', {})
+
+        crosswalk = cls(fuzzy=fuzzy)
+        for properties, key in zip((feature['properties'] for feature in geojson_data['features']),
+                                   feature_keys(geojson_data).tolist()):
+            if key == MISSING:
+                continue
+            for name in feature_name_variants(properties):
+                crosswalk.names[normalize_name(name)] = key
+        return crosswalk
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        atomic.write_json({'fuzzy': self.fuzzy}, path, ensure_ascii=False, sort_keys=True)
+
+    def fuzzy_match(self, normalized):
+        """
+        Return the key of the closest known name in the same state, or MISSING.
+        """
+        if normalized not in self.fuzzy:
+            state = state_of(normalized)
+            candidates = [name for name in self.names if state_of(name) == state]
+            match = difflib.get_close_matches(normalized, candidates, n=1, cutoff=FUZZY_CUTOFF)
+            self.fuzzy[normalized] = self.names[match[0]] if match else MISSING
+            if match:
+                logging.info("Matched %r to %r", normalized, match[0])
+        return self.fuzzy[normalized]
+
+    def keys_for_names(self, names, source):
+        """
+        Return integer keys for a column of county names, recording how many
+        matched exactly, by fuzzy match, or not at all under report[source].
+        """
+        names = pd.Series(names, dtype=object)
+        normalized = names.fillna('').astype(str).map(normalize_name)
+        keys = normalized.map(self.names)
+
+        misses = keys.isna()
+        fuzzy_keys = normalized[misses].map(self.fuzzy_match)
+        keys[misses] = fuzzy_keys
+        keys = keys.astype(np.int64).to_numpy()
+
+        # Blank rows (e.g. a footer line in an export) are not worth listing
+        unmatched = sorted(set(names[keys == MISSING].dropna().astype(str)) - {''})
+        self.report[source] = {
+            'rows': len(keys),
+            'exact': int((~misses).sum()),
+            'fuzzy': int((fuzzy_keys != MISSING).sum()),
+            'unmatched': unmatched,
+        }
+        if unmatched:
+            logging.warning("%s: %d of %d names not matched to a county, e.g. %s",
+                            source, len(unmatched), len(keys), ', '.join(unmatched[:5]))
+        return keys
+
+
+def feature_keys(geojson_data):
+    """
+    Return the integer key of every feature, from its 'id' or GEO_ID property.
+    """
+    ids = [feature['properties'].get('id') or feature['properties'].get('GEO_ID')
+           for feature in geojson_data['features']]
+    return fips_from_ids(ids)
+
+
+def load(geojson_data, cache_dir):
+    """
+    Build the crosswalk for a run, with the fuzzy matches remembered in cache_dir.
+    """
+    return Crosswalk.from_features(geojson_data, os.path.join(cache_dir, CROSSWALK_FILE))
+
+
+def save(crosswalk, cache_dir):
+    crosswalk.save(os.path.join(cache_dir, CROSSWALK_FILE))
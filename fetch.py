@@ -0,0 +1,193 @@
+"""
+Conditional, streaming downloads of remote source files.
+
+The ETag and Last-Modified headers from the previous download are kept in
+a small JSON file next to the data file and sent back as If-None-Match /
+If-Modified-Since, so an unchanged file costs one 304 round trip instead
+of a full download. New content is streamed to a temporary file in
+chunks and renamed into place only once it is complete.
+
+FetchScheduler downloads every source a run needs in parallel over one
+pooled session, retrying transient failures with exponential backoff.
+"""
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import atomic
+
+CHUNK_SIZE = 1 << 16
+
+# Seconds to wait for the connection and between received bytes
+TIMEOUT = (10, 60)
+
+# Parallel downloads and attempts per source
+MAX_WORKERS = 4
+RETRIES = 3
+BACKOFF = 2.0
+
+# path: local file, changed: False when the server answered 304 Not Modified
+FetchResult = namedtuple('FetchResult', ['path', 'changed'])
+
+# A remote file the pipeline downloads into its download directory
+Source = namedtuple('Source', ['name', 'url', 'file_name'])
+
+
+def meta_path(path):
+    return path + '.meta.json'
+
+
+def load_meta(path):
+    """
+    Return the validators saved for a previously downloaded file, if any.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(meta_path(path), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_meta(path, meta):
+    atomic.write_json(meta, meta_path(path))
+
+
+def conditional_headers(meta):
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+
+def fetch(url, path, session=None, timeout=TIMEOUT, force=False):
+    """
+    Download url to path unless the server says the copy at path is current.
+
+    Returns a FetchResult; result.changed is False when nothing was downloaded.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    meta = {} if force else load_meta(path)
+    # Validators from a different URL do not describe this file
+    if meta.get('url') not in (None, url):
+        meta = {}
+    http = session or requests
+
+    logging.info("Downloading %s", url)
+    with http.get(url, headers=conditional_headers(meta), stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            logging.info("%s has not changed since the last download", os.path.basename(path))
+            return FetchResult(path, False)
+        response.raise_for_status()
+
+        with atomic.open_atomic(path, 'wb') as file:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                file.write(chunk)
+            if file.tell() == 0:
+                raise RuntimeError(f"Empty response from {url}")
+
+        save_meta(path, {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        })
+    return FetchResult(path, True)
+
+
+def is_retryable(error):
+    """
+    Connection problems, timeouts and 5xx/429 answers are worth retrying;
+    other HTTP errors will not fix themselves.
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def fetch_with_retries(url, path, session=None, retries=RETRIES, backoff=BACKOFF, timeout=TIMEOUT, force=False):
+    """
+    fetch() with up to 'retries' attempts, waiting backoff, 2 * backoff, ...
+    between them.
+    """
+    for attempt in range(retries):
+        try:
+            return fetch(url, path, session=session, timeout=timeout, force=force)
+        except requests.RequestException as error:
+            if attempt == retries - 1 or not is_retryable(error):
+                raise
+            delay = backoff * 2 ** attempt
+            logging.warning("Fetching %s failed (%s), retrying in %.1fs", url, error, delay)
+            time.sleep(delay)
+
+
+class FetchScheduler:
+    """
+    Download sources in parallel on a thread pool sharing one connection pool.
+
+        with FetchScheduler(download_dir) as downloads:
+            downloads.submit(source)
+            ...
+            result = downloads.result(source.name)   # waits for that file only
+    """
+
+    def __init__(self, download_dir, max_workers=MAX_WORKERS, retries=RETRIES, backoff=BACKOFF,
+                 timeout=TIMEOUT, force=False):
+        self.download_dir = download_dir
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.force = force
+        self.futures = {}
+        # Seconds from submit to completion, per source
+        self.seconds = {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+
+    def submit(self, source):
+        """
+        Start downloading a source unless it is already scheduled. Returns its future.
+        """
+        if source.name not in self.futures:
+            path = os.path.join(self.download_dir, source.file_name)
+            started = time.perf_counter()
+            future = self.executor.submit(
+                fetch_with_retries, source.url, path, session=self.session, retries=self.retries,
+                backoff=self.backoff, timeout=self.timeout, force=self.force)
+            future.add_done_callback(
+                lambda _, name=source.name: self.seconds.__setitem__(name, time.perf_counter() - started))
+            self.futures[source.name] = future
+        return self.futures[source.name]
+
+    def done(self, name):
+        return self.futures[name].done()
+
+    def result(self, name):
+        """
+        Wait for one source and return its FetchResult (re-raising its error).
+        """
+        return self.futures[name].result()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,204 @@
+"""
+Per-step instrumentation for a pipeline run and the JSON run report.
+
+Every fetch, parse, join and write step of a run is recorded with its
+duration, the resident set size before and after it, the bytes it read
+and wrote, and where it applies the rows it took in, the rows matched to
+a feature and the number of nulls per output property:
+
+    {"stage": "inventory", "step": "join", "seconds": 0.04,
+     "rss_before_bytes": 176160768, "rss_after_bytes": 181403648,
+     "process_peak_rss_bytes": 190316544, "bytes_read": 0, "bytes_written": 0,
+     "rows_in": 3024, "rows_matched": 3021, "nulls": {"HousingInventory": 122}}
+
+process_peak_rss_bytes is the high-water mark of the whole process so far,
+not the step's own peak: it only shows that a step raised the peak where
+it is higher than on the step recorded before it in the same process.
+
+Byte counts come from /proc/self/io and cover the whole process, so a step
+in the parent also counts downloads that finish while it runs; stages in
+worker processes are measured on their own.
+
+Stages get the run's Report as options['report']; step() turns into a
+no-op when there is none, so stages still run on their own.
+"""
+import cProfile
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then left out of the report
+    resource = None
+
+import atomic
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else None
+
+
+def current_rss():
+    """
+    Return the resident set size of this process in bytes right now, or
+    None where /proc/self/statm is not available.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, TypeError, ValueError):
+        return None
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process so far in bytes, or None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def io_counters():
+    """
+    Return (bytes read, bytes written) by this process's read/write calls
+    so far, or (None, None) where /proc/self/io is not available.
+    """
+    try:
+        with open('/proc/self/io', 'r') as file:
+            counters = dict(line.split(': ') for line in file.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def null_counts(geojson_data, properties, nest=None):
+    """
+    Count the features whose value for each property is null (or missing
+    from the 'nest' dict).
+    """
+    counts = dict.fromkeys(properties, 0)
+    for feature in geojson_data['features']:
+        values = feature['properties']
+        if nest is not None:
+            values = values.get(nest) or {}
+        for name in properties:
+            if values.get(name) is None:
+                counts[name] += 1
+    return counts
+
+
+class Report:
+    """
+    Records the steps of one run. Plain data only, so a worker process can
+    hand its steps back to the parent.
+    """
+
+    def __init__(self):
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.steps = []
+        self.extra = {}
+
+    @contextmanager
+    def step(self, stage, kind, **fields):
+        """
+        Time the block and record it as one step. The block can add counts
+        to the record it gets.
+        """
+        record = {'stage': stage, 'step': kind}
+        record.update(fields)
+        read_before, written_before = io_counters()
+        rss_before = current_rss()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - started, 6)
+            record['rss_before_bytes'] = rss_before
+            record['rss_after_bytes'] = current_rss()
+            record['process_peak_rss_bytes'] = peak_rss()
+            read_after, written_after = io_counters()
+            if read_before is not None:
+                record.setdefault('bytes_read', read_after - read_before)
+                record.setdefault('bytes_written', written_after - written_before)
+            self.steps.append(record)
+            log_step(record)
+
+    def extend(self, steps):
+        """
+        Append the steps a worker process recorded.
+        """
+        for record in steps:
+            self.steps.append(record)
+            log_step(record)
+
+    def add(self, stage, kind, **fields):
+        """
+        Record a step that was measured elsewhere (e.g. a download thread).
+        """
+        record = {'stage': stage, 'step': kind}
+        record.update(fields)
+        self.steps.append(record)
+        log_step(record)
+
+    def as_dict(self, **fields):
+        document = {'started': self.started, 'finished': datetime.now().isoformat(timespec='seconds')}
+        document.update(fields)
+        document.update(self.extra)
+        # Workers have their own peak, so this is the largest single process
+        document['process_peak_rss_bytes'] = max([peak_rss() or 0] + [step.get('process_peak_rss_bytes') or 0
+                                                                      for step in self.steps])
+        document['steps'] = self.steps
+        return document
+
+    def save(self, path, **fields):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        atomic.write_json(self.as_dict(**fields), path, indent=2, default=str)
+        logging.info("Run report written to %s", path)
+
+
+def log_step(record):
+    details = [f"{record[name]} {name.replace('_', ' ')}" for name in ('rows_in', 'rows_matched')
+               if record.get(name) is not None]
+    logging.info("%s %s: %.2fs%s", record['stage'], record['step'], record.get('seconds') or 0,
+                 f" ({', '.join(details)})" if details else '')
+    if record.get('rows_in') and record.get('rows_matched') == 0:
+        logging.warning("%s %s matched none of its %d rows", record['stage'], record['step'], record['rows_in'])
+
+
+def step(options, stage, kind, **fields):
+    """
+    options['report'].step(...) when the run has a report, otherwise a
+    context that yields a throwaway record.
+    """
+    report = options.get('report')
+    if report is None:
+        return nullcontext(dict(fields))
+    return report.step(stage, kind, **fields)
+
+
+def call(options, stage, func, *args):
+    """
+    Run func(*args) as the 'run' step of a stage, under cProfile when
+    options['profile'] names that stage. The profile is written to
+    options['profile_dir']/<stage>.prof.
+    """
+    with step(options, stage, 'run'):
+        if options.get('profile') != stage:
+            return func(*args)
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args)
+        finally:
+            profile_dir = options.get('profile_dir') or '.'
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f"{stage}.prof")
+            profiler.dump_stats(path)
+            logging.info("Profile of %s written to %s", stage, path)
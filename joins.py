@@ -0,0 +1,87 @@
+"""
+Columnar joins between the GeoJSON features and metric tables.
+
+Instead of building a dict per metric and walking the features for each
+one, the feature keys are pulled into a single index, the metric table is
+aligned to it with one reindex, rounding and NaN -> null are done on whole
+columns, and the results are written back to the features in one pass.
+"""
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+# One output property: the table column it comes from and how to round it.
+# decimals=None keeps the float as is, 0 truncates to int like int() did.
+Metric = namedtuple('Metric', ['property', 'column', 'decimals'])
+Metric.__new__.__defaults__ = (None,)
+
+
+def to_json_values(values, decimals=None):
+    """
+    Convert a numeric column to a list of plain Python values with NaN as None.
+    """
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+
+    if decimals == 0:
+        converted = np.trunc(np.where(missing, 0, values)).astype(np.int64).tolist()
+    elif decimals is not None:
+        converted = np.round(values, decimals).tolist()
+    else:
+        converted = values.tolist()
+
+    if missing.any():
+        for i in np.flatnonzero(missing).tolist():
+            converted[i] = None
+    return converted
+
+
+def align(keys, table, table_key, metrics):
+    """
+    Align 'table' to 'keys' on 'table_key' and return (columns, matched):
+    an OrderedDict of property -> list of JSON-ready values, and a boolean
+    array marking which keys were found in the table.
+    """
+    # Later rows win on duplicate keys, as they did with dict(zip(...))
+    source = table.drop_duplicates(subset=table_key, keep='last').set_index(table_key)
+    aligned = source[[metric.column for metric in metrics]].reindex(keys)
+
+    columns = OrderedDict()
+    for metric in metrics:
+        series = pd.to_numeric(aligned[metric.column], errors='coerce')
+        columns[metric.property] = to_json_values(series.to_numpy(dtype=float), metric.decimals)
+
+    matched = keys.isin(source.index)
+    return columns, np.asarray(matched)
+
+
+def write_properties(geojson_data, columns, nest=None, matched=None):
+    """
+    Write aligned columns back onto the features in one pass.
+
+    With 'nest', the values go into a dict property of that name, which is
+    left empty for features that were not matched.
+    """
+    names = list(columns)
+    rows = zip(*columns.values()) if names else ([] for _ in geojson_data['features'])
+    if matched is None:
+        matched = np.ones(len(geojson_data['features']), dtype=bool)
+
+    for feature, row, found in zip(geojson_data['features'], rows, matched.tolist()):
+        properties = feature['properties']
+        if nest is None:
+            properties.update(zip(names, row))
+        else:
+            properties[nest] = dict(zip(names, row)) if found else {}
+
+
+def join_keyed(geojson_data, keys, table, table_key, metrics, nest=None):
+    """
+    Join 'metrics' from 'table' onto the features whose key (an array in
+    feature order, e.g. the integer FIPS keys from crosswalk.py) equals
+    table[table_key]. Returns the number of features that were matched.
+    """
+    columns, matched = align(pd.Index(keys), table, table_key, metrics)
+    write_properties(geojson_data, columns, nest=nest, matched=matched)
+    return int(matched.sum())
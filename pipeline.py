@@ -0,0 +1,360 @@
+"""
+Single entry point for the monthly map refresh.
+
+Loads NewBasemapcopy1.geojson once, runs the registered enrichment stages
+from stages.py against the in-memory feature collection and adds the
+rental yield and map classes (see classify.py). The result is published
+to data/ as static geometry plus a monthly attribute table (see
+publish.py) and as a pyramid of vector tiles for the map (see tiles.py).
+
+The GeoJSON itself is only read. What the stages computed is kept in
+NewBasemapcopy1.geojson.stages.json, a small columnar table of their
+output properties plus the inputs each stage applied, and laid over the
+features on the next run, so a stage that is skipped or not selected
+keeps its last values. --write-geojson also writes the whole enriched
+collection back to the GeoJSON.
+
+    python pipeline.py                     # run every stage
+    python pipeline.py rent_prices         # refresh rent only
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from datetime import datetime
+
+import atomic
+import cache
+import classify
+import compact
+import crosswalk
+import fetch
+import instrument
+import publish
+import stages
+import tiles
+
+GEOJSON_PATH = 'NewBasemapcopy1.geojson'
+STATE_SUFFIX = '.stages.json'
+PUBLISH_DIR = 'data'
+REPORT_PATH = 'run-report.json'
+
+
+def default_options():
+    """
+    Return the options every stage can read, with the repo defaults.
+    """
+    return {
+        'today': datetime.now().date(),
+        'download_dir': stages.DOWNLOAD_DIR,
+        'inventory_path': 'inventory.csv',
+        'demographics_path': stages.DEMOGRAPHICS_PATH,
+        'cache_dir': cache.CACHE_DIR,
+        'publish_dir': PUBLISH_DIR,
+        'output_format': 'geojson',
+        'precision': compact.PRECISION,
+        'quantization': compact.QUANTIZATION,
+        'simplify': 0.0,
+        'write_geojson': False,
+        'minify': False,
+        'report_sizes': False,
+        'tiles': True,
+        'min_zoom': tiles.MIN_ZOOM,
+        'max_zoom': tiles.MAX_ZOOM,
+        'force': False,
+        'workers': None,
+        'breaks': None,
+        'report_path': REPORT_PATH,
+        'profile': None,
+        'profile_dir': None,
+    }
+
+
+def select_stages(names=None):
+    """
+    Return the requested stages in registration order (all when names is empty).
+    """
+    if not names:
+        return list(stages.STAGES.values())
+
+    unknown = [name for name in names if name not in stages.STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(unknown)}. Available: {', '.join(stages.STAGES)}")
+    return [registered for name, registered in stages.STAGES.items() if name in names]
+
+
+def load_geojson(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def output_properties():
+    """
+    Return every property the stages and classify() write onto the features.
+    """
+    return stages.output_properties() + classify.output_properties()
+
+
+def state_path(geojson_path):
+    return geojson_path + STATE_SUFFIX
+
+
+def load_state(geojson_path):
+    """
+    Return what earlier runs left for this GeoJSON: the inputs each stage
+    applied ('applied') and the output properties of every feature, as a
+    publish.attribute_table(). Empty when there is none.
+    """
+    try:
+        with open(state_path(geojson_path), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(geojson_data, applied, geojson_path):
+    state = publish.attribute_table(geojson_data, output_properties())
+    state['applied'] = applied
+    atomic.write_json(state, state_path(geojson_path), separators=compact.COMPACT, ensure_ascii=False)
+
+
+def run_parallel_stage(name, options):
+    """
+    Run a parallel stage, in a worker process or inline. Returns its
+    StageTable together with the crosswalk's fuzzy matches and report and
+    the instrument steps it recorded, so the parent can keep what the
+    worker learned.
+    """
+    options['report'] = instrument.Report()
+    result = instrument.call(options, name, stages.STAGES[name].func, options)
+    return result, options['crosswalk'].fuzzy, options['crosswalk'].report, options['report'].steps
+
+
+def ready_stages(pending, running, downloads):
+    """
+    Return the pending stages whose required stages have finished and whose
+    downloads have arrived, in registration order.
+    """
+    unfinished = {registered.name for registered in pending} | {registered.name for registered in running.values()}
+    return [registered for registered in pending
+            if not any(name in unfinished for name in registered.requires)
+            and all(downloads.done(name) for name in registered.sources)]
+
+
+def record_downloads(report, downloads):
+    """
+    Add a fetch step for every finished download to the run report.
+    """
+    for name, future in downloads.futures.items():
+        if not future.done() or future.exception() is not None:
+            continue
+        result = future.result()
+        size = os.path.getsize(result.path) if result.changed else 0
+        report.add(name, 'fetch', seconds=round(downloads.seconds.get(name, 0.0), 6), changed=result.changed,
+                   bytes_read=size, bytes_written=size)
+
+
+def run(stage_names=None, geojson_path=GEOJSON_PATH, options=None):
+    """
+    Run the selected stages against one in-memory copy of the GeoJSON, with
+    the outputs of earlier runs laid over it, and publish and save the
+    outputs once, unless every stage reported that it changed nothing.
+    Returns the updated feature collection.
+
+    Every remote source the selected stages read is downloaded in parallel
+    up front. Stages start as soon as their files have arrived and the
+    stages they require have finished: parallel stages (see stages.stage)
+    run in a process pool and hand back a table that is joined onto the
+    features here, so the wall-clock time is bounded by the slowest stage
+    rather than the sum of them. workers=1 runs everything in this process.
+
+    Every step is timed and counted into a JSON run report (see
+    instrument.py) written to options['report_path'], also when a stage fails.
+    """
+    selected = select_stages(stage_names)
+    run_options = default_options()
+    run_options.update(options or {})
+
+    report = instrument.Report()
+    run_options['report'] = report
+    if run_options['report_path'] and not run_options['profile_dir']:
+        run_options['profile_dir'] = os.path.dirname(os.path.abspath(run_options['report_path']))
+
+    status = {'status': 'failed'}
+    try:
+        geojson_data = run_stages(selected, geojson_path, run_options)
+        status['status'] = 'ok'
+        return geojson_data
+    except BaseException as error:
+        status['error'] = repr(error)
+        raise
+    finally:
+        if run_options['report_path']:
+            report.save(run_options['report_path'], geojson=geojson_path,
+                        stages=[registered.name for registered in selected],
+                        crosswalk=run_options['crosswalk'].report if 'crosswalk' in run_options else {},
+                        **status)
+
+
+def run_stages(selected, geojson_path, run_options):
+    """
+    The body of run(): download, run the stages, publish and save.
+    """
+    report = run_options['report']
+
+    parallel = [registered for registered in selected if registered.parallel]
+    workers = min(run_options['workers'] or os.cpu_count() or 1, len(parallel))
+    # Spawn rather than fork: the download threads are already running
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) \
+        if workers > 1 else None
+
+    with fetch.FetchScheduler(run_options['download_dir'], force=run_options['force']) as downloads, \
+            (pool or nullcontext()):
+        for registered in selected:
+            for name in registered.sources:
+                downloads.submit(stages.SOURCES[name])
+        run_options['downloads'] = downloads
+
+        with report.step('geojson', 'parse') as record:
+            geojson_data = load_geojson(geojson_path)
+            # Lets publish keep the encoded geometry while the source stays the same
+            run_options['geojson_hash'] = cache.file_hash(geojson_path)
+            state = load_state(geojson_path)
+            if 'columns' in state:
+                publish.join_attributes(geojson_data, state)
+            record['rows_in'] = len(geojson_data['features'])
+        run_options['crosswalk'] = crosswalk.load(geojson_data, run_options['cache_dir'])
+        run_options['applied'] = state.get('applied', {})
+
+        changed = False
+        pending = list(selected)
+        running = {}
+        # Inputs of the stages applied in this run, saved once their results are
+        applied = {}
+
+        def merge(registered, outcome):
+            result, fuzzy, crosswalk_report, steps = outcome
+            run_options['crosswalk'].fuzzy.update(fuzzy)
+            run_options['crosswalk'].report.update(crosswalk_report)
+            report.extend(steps)
+            if result and result.inputs is not None:
+                applied[registered.name] = result.inputs
+            with report.step(registered.name, 'join') as record:
+                return stages.merge_table(geojson_data, result, record)
+
+        while pending or running:
+            ready = ready_stages(pending, running, downloads)
+            for registered in ready:
+                pending.remove(registered)
+                logging.info("Running stage %s", registered.name)
+                if not registered.parallel:
+                    changed = instrument.call(run_options, registered.name, registered.func,
+                                              geojson_data, run_options) is not False or changed
+                    continue
+
+                # Workers get plain options: no scheduler, the finished downloads instead
+                worker_options = dict(run_options, downloads=None,
+                                      fetched={name: downloads.result(name) for name in registered.sources})
+                if pool is None:
+                    changed = merge(registered, run_parallel_stage(registered.name, worker_options)) or changed
+                else:
+                    running[pool.submit(run_parallel_stage, registered.name, worker_options)] = registered
+            if ready:
+                # A stage that just finished may have unblocked others
+                continue
+
+            waiting = list(running)
+            waiting += [downloads.futures[name] for registered in pending for name in registered.sources
+                        if not downloads.done(name)]
+            finished, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in running:
+                    changed = merge(running.pop(future), future.result()) or changed
+
+        # Keep the fuzzy name matches for the next run
+        crosswalk.save(run_options['crosswalk'], run_options['cache_dir'])
+        record_downloads(report, downloads)
+
+    if not changed:
+        logging.info("No stage changed any data, nothing to publish.")
+        return geojson_data
+
+    # Derived metrics and class breaks for the map, over the whole updated collection
+    with report.step('classes', 'classify') as record:
+        classes = classify.classify(geojson_data, method=run_options['breaks'])
+        record['rows_in'] = len(geojson_data['features'])
+        record['nulls'] = {name: info['nulls'] for name, info in classes.items()}
+
+    if run_options['write_geojson']:
+        with report.step('geojson', 'write') as record:
+            if run_options['minify']:
+                atomic.write_json(geojson_data, geojson_path, ensure_ascii=False, separators=compact.COMPACT)
+            else:
+                atomic.write_json(geojson_data, geojson_path, ensure_ascii=False, indent=2)
+            record['bytes_written'] = os.path.getsize(geojson_path)
+        logging.info("GeoJSON file updated successfully.")
+
+    if run_options['publish_dir']:
+        with report.step('publish', 'write') as record:
+            sizes = publish.publish(geojson_data, output_properties(),
+                                    run_options['publish_dir'], output_format=run_options['output_format'],
+                                    precision=run_options['precision'], quantization=run_options['quantization'],
+                                    simplify=run_options['simplify'], classes=classes,
+                                    source_hash=run_options['geojson_hash'], report_sizes=run_options['report_sizes'],
+                                    tile_zooms=(run_options['min_zoom'], run_options['max_zoom'])
+                                    if run_options['tiles'] else None)
+            record['rows_in'] = len(geojson_data['features'])
+        report.extra['publish'] = sizes
+
+    # Only now are the stages' results published; a run that fails before
+    # this point applies the same inputs again next time
+    with report.step('state', 'write') as record:
+        save_state(geojson_data, dict(run_options['applied'], **applied), geojson_path)
+        record['bytes_written'] = os.path.getsize(state_path(geojson_path))
+    return geojson_data
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('stages', nargs='*', help=f"stages to run (default: all of {', '.join(stages.STAGES)})")
+    parser.add_argument('--geojson', default=GEOJSON_PATH, help="feature collection to enrich")
+    parser.add_argument('--inventory', dest='inventory_path', help="UTF-16 inventory TSV")
+    parser.add_argument('--demographics', dest='demographics_path', help="census DHC P9 data CSV")
+    parser.add_argument('--download-dir', dest='download_dir', help="where downloaded source files are kept")
+    parser.add_argument('--force', action='store_true', help="download and reprocess sources even if unchanged")
+    parser.add_argument('--publish-dir', dest='publish_dir', help=f"where to publish geometry and attributes (default: {PUBLISH_DIR}, '' to skip)")
+    parser.add_argument('--format', dest='output_format', choices=compact.FORMATS,
+                        help="encoding of the published geometry (default: geojson)")
+    parser.add_argument('--precision', type=int, help=f"decimals kept in GeoJSON coordinates (default: {compact.PRECISION})")
+    parser.add_argument('--quantization', type=int, help=f"TopoJSON grid size (default: {compact.QUANTIZATION})")
+    parser.add_argument('--simplify', type=float, help="topology-preserving simplification tolerance in degrees")
+    parser.add_argument('--report-sizes', dest='report_sizes', action='store_true',
+                        help="re-encode the geometry and compare its size with indented GeoJSON in the run report")
+    parser.add_argument('--write-geojson', dest='write_geojson', action='store_true',
+                        help=f"also write the enriched features back to {GEOJSON_PATH}")
+    parser.add_argument('--minify', action='store_true', help="write the GeoJSON without indentation")
+    parser.add_argument('--no-tiles', dest='tiles', action='store_false', default=None,
+                        help="do not cut the published map into vector tiles")
+    parser.add_argument('--min-zoom', dest='min_zoom', type=int, help=f"lowest tile zoom level (default: {tiles.MIN_ZOOM})")
+    parser.add_argument('--max-zoom', dest='max_zoom', type=int, help=f"highest tile zoom level (default: {tiles.MAX_ZOOM})")
+    parser.add_argument('--workers', type=int,
+                        help="processes for the parallel stages (default: one per CPU, 1 runs them in this process)")
+    parser.add_argument('--breaks', choices=classify.METHODS,
+                        help="class breaks for every mapped metric (default: quantile for levels, jenks for growth)")
+    parser.add_argument('--report', dest='report_path',
+                        help=f"where to write the JSON run report (default: {REPORT_PATH}, '' to skip)")
+    parser.add_argument('--profile', choices=stages.STAGES, help="write a cProfile dump of this stage next to the report")
+    args = parser.parse_args(argv)
+
+    options = {key: value for key, value in vars(args).items()
+               if key not in ('stages', 'geojson') and value is not None}
+    run(args.stages, args.geojson, options)
+
+
+if __name__ == '__main__':
+    main()
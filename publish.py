@@ -0,0 +1,190 @@
+"""
+Publish the enriched map as a static geometry file plus a small attribute table.
+
+County polygons do not change between monthly refreshes, so they are written
+once to a content-addressed file (counties.<hash>.geojson, or .topojson)
+that browsers can cache forever, in one of the compact encodings from
+compact.py. The monthly numbers go into attributes.json, a columnar table
+keyed by GEO_ID that also names the geometry file to pair it with:
+
+    {
+      "key": "GEO_ID",
+      "geometry": "counties.1a2b3c4d5e6f.geojson",
+      "tiles": "tiles/1a2b3c4d5e6f-z3-8/",
+      "source": "9f86d081884c7d65...",
+      "ids": ["0500000US01001", ...],
+      "columns": {"HomePrices": [204000, ...], ...}
+    }
+
+'source' digests what the geometry file was encoded from (see
+geometry_source()); while it stays the same, later runs reuse the file
+without encoding the geometry again.
+
+snapshot.js loads both on the page and joins them back into one GeoJSON.
+With tile_zooms, the geometry is also cut into a pyramid of vector tiles
+(see tiles.py) named after the geometry file's hash, which the page loads
+instead and joins the same attributes onto.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+
+import atomic
+import compact
+import tiles
+
+ATTRIBUTES_FILE = 'attributes.json'
+CLASSES_FILE = 'classes.json'
+GEOMETRY_PATTERN = 'counties.*'
+
+
+def attribute_table(geojson_data, attribute_names, key='GEO_ID'):
+    """
+    Return attribute_names as columns in feature order, keyed by properties[key]:
+    {'key': key, 'ids': [...], 'columns': {name: [...]}}.
+    """
+    attribute_names = [name for name in attribute_names if name != key]
+    ids = []
+    columns = {name: [] for name in attribute_names}
+    for feature in geojson_data['features']:
+        properties = feature['properties']
+        ids.append(properties.get(key))
+        for name in attribute_names:
+            columns[name].append(properties.get(name))
+    return {'key': key, 'ids': ids, 'columns': columns}
+
+
+def join_attributes(geojson_data, attributes):
+    """
+    Copy every column of an attribute_table() onto the feature with the
+    matching key. Features without a row keep their properties.
+    """
+    row_by_id = {feature_id: row for row, feature_id in enumerate(attributes['ids']) if feature_id is not None}
+    columns = attributes['columns']
+    for feature in geojson_data['features']:
+        properties = feature['properties']
+        row = row_by_id.get(properties.get(attributes['key']))
+        if row is None:
+            continue
+        for name, values in columns.items():
+            properties[name] = values[row]
+
+
+def split_snapshot(geojson_data, attribute_names, key='GEO_ID'):
+    """
+    Split a feature collection into (geometry, attributes).
+
+    'geometry' keeps every feature's geometry and the properties that are
+    not in attribute_names; 'attributes' is their attribute_table().
+    """
+    attribute_set = set(name for name in attribute_names if name != key)
+    features = [{
+        'type': 'Feature',
+        'properties': {name: value for name, value in feature['properties'].items() if name not in attribute_set},
+        'geometry': feature['geometry'],
+    } for feature in geojson_data['features']]
+
+    geometry = {'type': 'FeatureCollection', 'features': features}
+    return geometry, attribute_table(geojson_data, attribute_names, key)
+
+
+def geometry_source(source_hash, attribute_names, key, output_format, precision, quantization, simplify):
+    """
+    Return a digest of everything the geometry file is made from: the hash
+    of the file the features were read from, which properties stay in the
+    geometry and the encoding options.
+    """
+    parts = [source_hash, sorted(set(attribute_names) - {key}), key, output_format, precision, quantization, simplify]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def published_attributes(out_dir):
+    """
+    Return the attributes.json currently in out_dir, or {}.
+    """
+    try:
+        with open(os.path.join(out_dir, ATTRIBUTES_FILE), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def publish(geojson_data, attribute_names, out_dir, key='GEO_ID', output_format='geojson',
+            precision=compact.PRECISION, quantization=compact.QUANTIZATION, simplify=0.0, classes=None,
+            source_hash=None, report_sizes=False, tile_zooms=None):
+    """
+    Write the geometry file (only if its content changed) and attributes.json
+    into out_dir, plus classes.json with the class breaks from classify.py
+    when 'classes' is given. Returns the compact.encode() size report for
+    the geometry.
+
+    'source_hash' is a hash of the file geojson_data was read from. When it
+    is given and the published geometry was encoded from the same source
+    with the same options, that file is kept as it is without encoding
+    the geometry again. report_sizes always encodes it, and passes on to
+    compact.encode() to compare the size with indented GeoJSON.
+
+    tile_zooms, a (min_zoom, max_zoom) pair, also publishes the geometry
+    as vector tiles, cut only when there is no pyramid for it yet.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    source = None
+    if source_hash is not None:
+        source = geometry_source(source_hash, attribute_names, key, output_format, precision, quantization, simplify)
+    previous = published_attributes(out_dir) if source is not None else {}
+
+    if source is not None and not report_sizes and previous.get('source') == source and previous.get('geometry') \
+            and os.path.exists(os.path.join(out_dir, previous['geometry'])):
+        geometry_name = previous['geometry']
+        logging.info("Geometry source unchanged, keeping %s", geometry_name)
+        geometry = None
+        attributes = attribute_table(geojson_data, attribute_names, key)
+        report = {'format': output_format, 'reused': True}
+    else:
+        geometry, attributes = split_snapshot(geojson_data, attribute_names, key)
+        geometry_bytes, report = compact.encode(geometry, output_format, precision=precision,
+                                                quantization=quantization, simplify=simplify,
+                                                report_sizes=report_sizes)
+        digest = hashlib.sha256(geometry_bytes).hexdigest()[:12]
+        geometry_name = f"counties.{digest}.{output_format}"
+        geometry_path = os.path.join(out_dir, geometry_name)
+
+        if os.path.exists(geometry_path):
+            logging.info("Geometry unchanged, keeping %s", geometry_name)
+        else:
+            logging.info("Writing %s (%d bytes)", geometry_name, len(geometry_bytes))
+            atomic.write_bytes(geometry_bytes, geometry_path)
+
+    attributes['geometry'] = geometry_name
+    pyramid = None
+    if tile_zooms is not None:
+        pyramid = tiles.pyramid_name(geometry_name.split('.')[1], *tile_zooms)
+        if os.path.isdir(os.path.join(out_dir, tiles.TILES_DIR, pyramid)):
+            logging.info("Tiles for %s exist, keeping %s", geometry_name, pyramid)
+        else:
+            if geometry is None:
+                geometry, _ = split_snapshot(geojson_data, attribute_names, key)
+            report['tiles'] = tiles.write_tiles(geometry, out_dir, pyramid, key, *tile_zooms)
+        attributes['tiles'] = f"{tiles.TILES_DIR}/{pyramid}/"
+    if source is not None:
+        attributes['source'] = source
+    if classes is not None:
+        # Written first, so a page that sees the new class indices also finds their breaks
+        atomic.write_bytes(json.dumps(classes, separators=compact.COMPACT).encode('utf-8'),
+                           os.path.join(out_dir, CLASSES_FILE))
+    attributes_bytes = json.dumps(attributes, separators=compact.COMPACT, ensure_ascii=False).encode('utf-8')
+    atomic.write_bytes(attributes_bytes, os.path.join(out_dir, ATTRIBUTES_FILE))
+    logging.info("Writing %s (%d bytes)", ATTRIBUTES_FILE, len(attributes_bytes))
+
+    # Older geometry files and tiles are no longer referenced by attributes.json
+    for old_path in glob.glob(os.path.join(out_dir, GEOMETRY_PATTERN)):
+        if os.path.basename(old_path) != geometry_name:
+            os.remove(old_path)
+    if pyramid is not None:
+        tiles.remove_old_pyramids(out_dir, pyramid)
+
+    report['geometry'] = geometry_name
+    report['attributes_bytes'] = len(attributes_bytes)
+    return report
@@ -0,0 +1,85 @@
+// Read one county's history from the time-series store written by
+// timeseries.py: the shared index.json is fetched once, then each metric's
+// values come from a single HTTP Range request into its packed .f32 file.
+var seriesIndexes = {};
+
+function loadSeriesIndex(baseUrl) {
+    if (!(baseUrl in seriesIndexes)) {
+        seriesIndexes[baseUrl] = fetch(baseUrl + 'index.json').then(function (response) {
+            return response.json();
+        }).then(function (index) {
+            index.rowById = {};
+            index.ids.forEach(function (id, row) {
+                index.rowById[id] = row;
+            });
+            return index;
+        });
+    }
+    return seriesIndexes[baseUrl];
+}
+
+function fetchFloat32Range(url, offset, length) {
+    var first = offset * 4;
+    var last = (offset + length) * 4 - 1;
+    return fetch(url, { headers: { Range: 'bytes=' + first + '-' + last } }).then(function (response) {
+        return response.arrayBuffer().then(function (buffer) {
+            // Servers that ignore Range send the whole file
+            if (response.status !== 206) {
+                buffer = buffer.slice(first, last + 1);
+            }
+            return new Float32Array(buffer);
+        });
+    });
+}
+
+// Resolve to {metric: [{date: 'YYYY-MM', value: number|null}, ...]} for one county id
+function loadCountySeries(baseUrl, id) {
+    return loadSeriesIndex(baseUrl).then(function (index) {
+        var row = index.rowById[id];
+        var metrics = Object.keys(index.metrics);
+        return Promise.all(metrics.map(function (metric) {
+            var meta = index.metrics[metric];
+            if (row === undefined || meta.length[row] === 0) {
+                return [];
+            }
+            return fetchFloat32Range(baseUrl + meta.file, meta.offset[row], meta.length[row]).then(function (values) {
+                return Array.from(values, function (value, i) {
+                    return { date: index.months[meta.start[row] + i], value: isNaN(value) ? null : value };
+                });
+            });
+        })).then(function (series) {
+            var result = {};
+            metrics.forEach(function (metric, i) {
+                result[metric] = series[i];
+            });
+            return result;
+        });
+    });
+}
+
+// Resolve to {id: value|null} for one month of the growth cube written by
+// timeseries.build_cube(), e.g. loadCubeMonth('data/cube/', 'rent', 'yoy', '2024-03').
+// The cube is month-major, so a month is one Range request of ids.length values.
+var cubeIndexes = {};
+
+function loadCubeMonth(baseUrl, metric, measure, month) {
+    if (!(baseUrl in cubeIndexes)) {
+        cubeIndexes[baseUrl] = fetch(baseUrl + 'index.json').then(function (response) {
+            return response.json();
+        });
+    }
+    return cubeIndexes[baseUrl].then(function (index) {
+        var monthIndex = index.months.indexOf(month);
+        if (monthIndex < 0) {
+            return {};
+        }
+        var count = index.ids.length;
+        return fetchFloat32Range(baseUrl + index.files[metric][measure], monthIndex * count, count).then(function (values) {
+            var byId = {};
+            index.ids.forEach(function (id, i) {
+                byId[id] = isNaN(values[i]) ? null : values[i];
+            });
+            return byId;
+        });
+    });
+}
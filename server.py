@@ -0,0 +1,467 @@
+"""
+Local HTTP query service over the published map data.
+
+Loads data/attributes.json and the geometry file it names (see
+publish.py) into an in-memory columnar table indexed by county key and
+state, with a grid spatial index over the county bounding boxes, and
+answers JSON queries:
+
+    GET /meta                                  columns, row count, snapshot
+    GET /county/01001                          one county (5-digit id or GEO_ID)
+    GET /top?metric=rentgrowthYoY&n=10         top N by a metric (&state=TX, &order=asc)
+    GET /top?metric=demographics.white_percentage   numeric members of dict columns too
+    GET /states?metric=HomePrices              count/mean/median/min/max per state
+    GET /states/TX                             the same for every metric of one state
+    GET /bbox?bbox=-100,30,-95,35              features intersecting a lon/lat box
+
+Responses are gzip-compressed when the client accepts it, repeated queries
+are answered from an LRU cache, and the table is reloaded as soon as the
+pipeline publishes a new attributes.json.
+
+    python server.py                       # serve data/ on 127.0.0.1:8000
+    python server.py --port 8080 --publish-dir data
+"""
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+import compact
+import crosswalk
+import pipeline
+import publish
+import tiles
+from joins import to_json_values
+
+HOST = '127.0.0.1'
+PORT = 8000
+CACHE_SIZE = 256
+POLL_SECONDS = 2.0
+
+# Zoom level of the tile grid used as spatial index buckets
+INDEX_ZOOM = 6
+
+# Smallest response worth compressing
+GZIP_MIN_BYTES = 1024
+
+
+class QueryError(ValueError):
+    """A bad request: unknown metric, malformed parameter, ..."""
+
+
+class NotFound(LookupError):
+    """The requested county, state or route does not exist."""
+
+
+def state_of(properties, key):
+    """
+    Return the state a feature belongs to: the postal code from its name
+    ('Autauga, AL') or else the first two digits of its FIPS code.
+    """
+    name = properties.get('CountyNamesBase_NAMECOUNTY') or properties.get('CountyName') or ''
+    if ', ' in name:
+        return name.rsplit(', ', 1)[1].upper()
+    return f"{key // 1000:02d}" if key != crosswalk.MISSING else ''
+
+
+def load_geometry(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        data = json.load(file)
+    if data.get('type') == 'Topology':
+        return compact.from_topojson(data)
+    return data
+
+
+def geometry_bbox(geometry):
+    """
+    Return (min_lon, min_lat, max_lon, max_lat) of a (Multi)Polygon, or None.
+    """
+    rings = [np.asarray(ring, dtype=float)[:, :2] for polygon in compact.polygons_of(geometry) for ring in polygon]
+    if not rings:
+        return None
+    points = np.vstack(rings)
+    return (*points.min(axis=0), *points.max(axis=0))
+
+
+class Snapshot:
+    """
+    One published snapshot held as columns: numeric metrics as float arrays
+    (NaN for null), other attributes (e.g. the demographics dicts) as lists,
+    plus the features' static properties and geometry for /bbox.
+    """
+
+    def __init__(self, publish_dir):
+        self.path = os.path.join(publish_dir, publish.ATTRIBUTES_FILE)
+        self.mtime = os.path.getmtime(self.path)
+        with open(self.path, 'r', encoding='utf-8') as file:
+            attributes = json.load(file)
+
+        self.key = attributes['key']
+        self.ids = attributes['ids']
+        self.geometry_file = attributes.get('geometry')
+        self.keys = crosswalk.fips_from_ids(self.ids)
+        self.row_of = {key: row for row, key in enumerate(self.keys.tolist()) if key != crosswalk.MISSING}
+
+        self.numeric = OrderedDict()
+        self.other = OrderedDict()
+        # Metrics published as whole numbers (prices, inventory) are served as ints again
+        self.integer = set()
+        # '<column>.<member>' metrics taken from dict columns such as demographics
+        self.nested = set()
+        for name, values in attributes['columns'].items():
+            if not self.add_numeric(name, values):
+                self.other[name] = values
+            if all(value is None or isinstance(value, dict) for value in values):
+                members = OrderedDict.fromkeys(member for value in values if value for member in value)
+                for member in members:
+                    dotted = f"{name}.{member}"
+                    if self.add_numeric(dotted, [(value or {}).get(member) for value in values]):
+                        self.nested.add(dotted)
+
+        # Static properties and geometry, in the same row order as the columns
+        self.static = [{} for _ in self.ids]
+        self.geometries = [None] * len(self.ids)
+        if self.geometry_file:
+            for feature in load_geometry(os.path.join(publish_dir, self.geometry_file))['features']:
+                row = self.row_of.get(crosswalk.fips_from_ids([feature['properties'].get(self.key)])[0])
+                if row is not None:
+                    self.static[row] = feature['properties']
+                    self.geometries[row] = feature['geometry']
+
+        self.states = OrderedDict()
+        for row, (properties, key) in enumerate(zip(self.static, self.keys.tolist())):
+            self.states.setdefault(state_of(properties, key), []).append(row)
+        self.states = OrderedDict((state, np.array(rows)) for state, rows in sorted(self.states.items()))
+
+        self.build_spatial_index()
+        logging.info("Loaded %d counties, %d metrics from %s", len(self.ids), len(self.numeric), self.path)
+
+    def add_numeric(self, name, values):
+        """
+        Add a column as a numeric metric if all its values are numbers or
+        null. Returns whether it was added.
+        """
+        if not all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+                   for value in values):
+            return False
+        self.numeric[name] = np.array([np.nan if value is None else value for value in values], dtype=float)
+        if all(value is None or isinstance(value, int) for value in values):
+            self.integer.add(name)
+        return True
+
+    def build_spatial_index(self):
+        """
+        Bucket every county into the INDEX_ZOOM tiles its bounding box
+        touches, and keep the boxes as arrays for the exact test.
+        """
+        boxes = [geometry_bbox(geometry) if geometry else None for geometry in self.geometries]
+        self.bboxes = np.array([box or (np.nan,) * 4 for box in boxes], dtype=float).reshape(-1, 4)
+        self.grid = {}
+        for row, box in enumerate(boxes):
+            if box is None:
+                continue
+            x0, y0, x1, y1 = tiles.tile_range(box, INDEX_ZOOM)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.grid.setdefault((x, y), []).append(row)
+
+    def rows_in_bbox(self, bbox):
+        x0, y0, x1, y1 = tiles.tile_range(bbox, INDEX_ZOOM)
+        candidates = {row for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) for row in self.grid.get((x, y), ())}
+        if not candidates:
+            return np.array([], dtype=int)
+        rows = np.array(sorted(candidates))
+        boxes = self.bboxes[rows]
+        min_lon, min_lat, max_lon, max_lat = bbox
+        hits = (boxes[:, 0] <= max_lon) & (boxes[:, 2] >= min_lon) & (boxes[:, 1] <= max_lat) & (boxes[:, 3] >= min_lat)
+        return rows[hits]
+
+    def row(self, county_id):
+        key = crosswalk.fips_from_ids([county_id])[0]
+        if key not in self.row_of:
+            raise NotFound(f"Unknown county {county_id!r}")
+        return self.row_of[key]
+
+    def state_rows(self, state):
+        state = state.upper()
+        if state not in self.states:
+            raise NotFound(f"Unknown state {state!r}")
+        return self.states[state]
+
+    def metric_name(self, name):
+        """
+        Return the metric 'name' refers to: a column, a dotted dict member,
+        or a member name alone (white_percentage) when only one column has it.
+        """
+        if name in self.numeric:
+            return name
+        matches = [dotted for dotted in self.nested if dotted.endswith(f".{name}")]
+        if len(matches) == 1:
+            return matches[0]
+        raise QueryError(f"Unknown metric {name!r}, expected one of {', '.join(self.numeric)}")
+
+    def metric(self, name):
+        return self.numeric[self.metric_name(name)]
+
+    def value(self, name, row):
+        value = self.numeric[name][row].item()
+        if math.isnan(value):
+            return None
+        return int(value) if name in self.integer else value
+
+    def record(self, row, names=None):
+        """
+        Return the attributes of one row as a JSON-ready dict.
+        """
+        # Dict members are already in their dict column unless asked for by name
+        values = {name: self.value(name, row) for name in self.numeric
+                  if (name not in self.nested if names is None else name in names)}
+        values.update((name, column[row]) for name, column in self.other.items() if names is None or name in names)
+        return values
+
+    def name(self, row):
+        names = self.other.get('CountyName')
+        return (names[row] if names else None) or self.static[row].get('CountyNamesBase_NAMECOUNTY')
+
+    def feature(self, row, names=None):
+        properties = dict(self.static[row])
+        properties.update(self.record(row, names))
+        return {'type': 'Feature', 'properties': properties, 'geometry': self.geometries[row]}
+
+
+def aggregate(values):
+    """
+    Return count/mean/median/min/max of the non-null values.
+    """
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'count': 0, 'mean': None, 'median': None, 'min': None, 'max': None}
+    mean, median, low, high = to_json_values([values.mean(), np.median(values), values.min(), values.max()], 4)
+    return {'count': int(len(values)), 'mean': mean, 'median': median, 'min': low, 'max': high}
+
+
+def first(params, name, default=None):
+    values = params.get(name)
+    return values[0] if values else default
+
+
+def parse_bbox(text):
+    try:
+        bbox = [float(part) for part in (text or '').split(',')]
+    except ValueError:
+        bbox = []
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise QueryError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    return bbox
+
+
+def query(snapshot, path, params):
+    """
+    Answer one request against a snapshot. Returns a JSON-ready object.
+    """
+    parts = [unquote(part) for part in path.strip('/').split('/') if part]
+
+    if parts == ['meta']:
+        return {'key': snapshot.key, 'count': len(snapshot.ids), 'geometry': snapshot.geometry_file,
+                'metrics': list(snapshot.numeric), 'other': list(snapshot.other), 'states': list(snapshot.states),
+                'loaded': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(snapshot.mtime))}
+
+    if len(parts) == 2 and parts[0] == 'county':
+        row = snapshot.row(parts[1])
+        return {'id': snapshot.ids[row], 'properties': snapshot.feature(row)['properties']}
+
+    if parts == ['top']:
+        metric = snapshot.metric_name(first(params, 'metric'))
+        values = snapshot.metric(metric)
+        try:
+            n = int(first(params, 'n', 10))
+        except ValueError:
+            raise QueryError("n must be an integer")
+        rows = snapshot.state_rows(first(params, 'state')) if first(params, 'state') else np.arange(len(values))
+        rows = rows[~np.isnan(values[rows])]
+        ascending = first(params, 'order', 'desc') == 'asc'
+        order = np.argsort(values[rows] if ascending else -values[rows], kind='stable')[:max(n, 0)]
+        return {'metric': metric, 'order': 'asc' if ascending else 'desc', 'counties': [
+            {'id': snapshot.ids[row], 'name': snapshot.name(row), metric: snapshot.value(metric, row)}
+            for row in rows[order].tolist()]}
+
+    if parts == ['states']:
+        metric = snapshot.metric_name(first(params, 'metric'))
+        values = snapshot.metric(metric)
+        return {'metric': metric, 'states': {state: aggregate(values[rows]) for state, rows in snapshot.states.items()}}
+
+    if len(parts) == 2 and parts[0] == 'states':
+        rows = snapshot.state_rows(parts[1])
+        return {'state': parts[1].upper(), 'counties': len(rows),
+                'metrics': {name: aggregate(values[rows]) for name, values in snapshot.numeric.items()}}
+
+    if parts == ['bbox']:
+        bbox = parse_bbox(first(params, 'bbox'))
+        names = set(first(params, 'properties').split(',')) if first(params, 'properties') else None
+        return {'type': 'FeatureCollection',
+                'features': [snapshot.feature(row, names) for row in snapshot.rows_in_bbox(bbox).tolist()]}
+
+    raise NotFound(f"No route for {path!r}")
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache of encoded responses.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class Service:
+    """
+    The current snapshot, its response cache and the reload watcher.
+    """
+
+    def __init__(self, publish_dir, cache_size=CACHE_SIZE):
+        self.publish_dir = publish_dir
+        self.cache = LRUCache(cache_size)
+        self.snapshot = Snapshot(publish_dir)
+        self.stopped = threading.Event()
+
+    def reload_if_changed(self):
+        """
+        Load the published snapshot again if attributes.json was replaced.
+        The old snapshot keeps serving until the new one is ready.
+        """
+        try:
+            mtime = os.path.getmtime(self.snapshot.path)
+        except OSError:
+            return False
+        if mtime == self.snapshot.mtime:
+            return False
+        try:
+            snapshot = Snapshot(self.publish_dir)
+        except (OSError, ValueError, KeyError) as error:
+            # Caught mid-publish (e.g. the geometry file is not there yet); try again next poll
+            logging.warning("Reloading %s failed: %s", self.snapshot.path, error)
+            return False
+        self.snapshot = snapshot
+        self.cache.clear()
+        return True
+
+    def watch(self, interval=POLL_SECONDS):
+        while not self.stopped.wait(interval):
+            self.reload_if_changed()
+
+    def respond(self, target):
+        """
+        Return (status, body bytes) for a request target, from the cache if possible.
+        """
+        snapshot = self.snapshot
+        key = (snapshot.mtime, target)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        url = urlsplit(target)
+        try:
+            result = 200, query(snapshot, url.path, parse_qs(url.query))
+        except NotFound as error:
+            result = 404, {'error': str(error)}
+        except QueryError as error:
+            result = 400, {'error': str(error)}
+
+        status, data = result
+        body = json.dumps(data, separators=compact.COMPACT, ensure_ascii=False, allow_nan=False).encode('utf-8')
+        compressed = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+        response = (status, body, compressed)
+        if status == 200:
+            self.cache.put(key, response)
+        return response
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body, compressed = service.respond(self.path)
+            if compressed is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = compressed
+                encoding = 'gzip'
+            else:
+                encoding = None
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Vary', 'Accept-Encoding')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.info("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+
+def serve(publish_dir=pipeline.PUBLISH_DIR, host=HOST, port=PORT, cache_size=CACHE_SIZE, poll=POLL_SECONDS):
+    service = Service(publish_dir, cache_size)
+    watcher = threading.Thread(target=service.watch, args=(poll,), name='reload', daemon=True)
+    watcher.start()
+
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    logging.info("Serving %s on http://%s:%d/", publish_dir, host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stopped.set()
+        server.server_close()
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--publish-dir', dest='publish_dir', default=pipeline.PUBLISH_DIR,
+                        help=f"directory the pipeline publishes to (default: {pipeline.PUBLISH_DIR})")
+    parser.add_argument('--host', default=HOST, help=f"address to listen on (default: {HOST})")
+    parser.add_argument('--port', type=int, default=PORT, help=f"port to listen on (default: {PORT})")
+    parser.add_argument('--cache-size', dest='cache_size', type=int, default=CACHE_SIZE,
+                        help=f"responses kept in the LRU cache (default: {CACHE_SIZE})")
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS,
+                        help=f"seconds between checks for a new snapshot (default: {POLL_SECONDS})")
+    args = parser.parse_args(argv)
+    serve(args.publish_dir, args.host, args.port, args.cache_size, args.poll)
+
+
+if __name__ == '__main__':
+    main()
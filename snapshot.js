@@ -0,0 +1,81 @@
+// Load the monthly attributes.json table. It is always revalidated; the
+// geometry file and tile pyramid it names change name whenever their
+// content does, so the browser can keep those cached.
+function loadAttributes(baseUrl) {
+    return fetch(baseUrl + 'attributes.json', { cache: 'no-cache' })
+        .then(function (response) { return response.json(); });
+}
+
+// Load the published map snapshot: the long-lived county geometry file and
+// the monthly attributes, joined back into one GeoJSON object.
+function loadSnapshot(baseUrl, attributes) {
+    var loaded = attributes ? Promise.resolve(attributes) : loadAttributes(baseUrl);
+    return loaded.then(function (attributes) {
+        return fetch(baseUrl + attributes.geometry)
+            .then(function (response) { return response.json(); })
+            .then(function (geometry) {
+                var geojson = geometry.type === 'Topology' ? topologyToGeoJSON(geometry) : geometry;
+                return joinAttributes(geojson, attributes);
+            });
+    });
+}
+
+// Decode the quantized, delta-encoded TopoJSON written by compact.py
+function topologyToGeoJSON(topology) {
+    var scale = topology.transform.scale;
+    var translate = topology.transform.translate;
+    var arcs = topology.arcs.map(function (arc) {
+        var x = 0, y = 0;
+        return arc.map(function (delta) {
+            x += delta[0];
+            y += delta[1];
+            return [x * scale[0] + translate[0], y * scale[1] + translate[1]];
+        });
+    });
+
+    // A negative index ~i means arc i walked backwards
+    function ring(arcIndexes) {
+        var points = [];
+        arcIndexes.forEach(function (index, i) {
+            var arc = index >= 0 ? arcs[index] : arcs[~index].slice().reverse();
+            points = points.concat(i === 0 ? arc : arc.slice(1));
+        });
+        return points;
+    }
+
+    function polygon(rings) {
+        return rings.map(ring);
+    }
+
+    var objectName = Object.keys(topology.objects)[0];
+    return {
+        type: 'FeatureCollection',
+        features: topology.objects[objectName].geometries.map(function (geometry) {
+            return {
+                type: 'Feature',
+                properties: geometry.properties,
+                geometry: {
+                    type: geometry.type,
+                    coordinates: geometry.type === 'Polygon' ? polygon(geometry.arcs) : geometry.arcs.map(polygon)
+                }
+            };
+        })
+    };
+}
+
+// Copy every attribute column onto the feature with the matching key
+function joinAttributes(geojson, attributes) {
+    var rowById = {};
+    attributes.ids.forEach(function (id, row) {
+        rowById[id] = row;
+    });
+
+    var names = Object.keys(attributes.columns);
+    geojson.features.forEach(function (feature) {
+        var row = rowById[feature.properties[attributes.key]];
+        names.forEach(function (name) {
+            feature.properties[name] = row === undefined ? null : attributes.columns[name][row];
+        });
+    });
+    return geojson;
+}
@@ -0,0 +1,348 @@
+import logging
+import os
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import cache
+import crosswalk
+import fetch
+import instrument
+import timeseries
+from joins import Metric, join_keyed
+
+# Registry of enrichment stages, in the order they should run
+STAGES = OrderedDict()
+
+Stage = namedtuple('Stage', ['name', 'func', 'requires', 'sources', 'outputs', 'parallel'])
+
+# What a parallel stage hands back to the parent: rows keyed by an integer
+# 'fips' column and the metrics to join from them (see join_fips), plus the
+# inputs it was computed from, recorded once the features are saved
+StageTable = namedtuple('StageTable', ['table', 'metrics', 'nest', 'inputs'], defaults=(None,))
+
+# Default location for downloaded source files
+DOWNLOAD_DIR = os.path.join(os.path.expanduser("~"), "Desktop", "leaflet")
+
+HOME_PRICES_URL = "https://files.zillowstatic.com/research/public_csvs/zhvi/County_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv?t=1716078501"
+RENT_PRICES_URL = "https://files.zillowstatic.com/research/public_csvs/zori/County_zori_uc_sfrcondomfr_sm_month.csv?t=1716078501"
+
+# Remote files, downloaded in parallel before the stages that read them run
+SOURCES = OrderedDict((source.name, source) for source in [
+    fetch.Source('home_prices', HOME_PRICES_URL, 'home_prices.csv'),
+    fetch.Source('rent_prices', RENT_PRICES_URL, 'rent_prices.csv'),
+])
+
+
+def stage(name, requires=(), sources=(), outputs=(), parallel=False):
+    """
+    Register a function as an enrichment stage.
+
+    A stage is called as func(geojson_data, options) and updates the feature
+    properties in place. It may return False to report that it left the
+    features untouched. 'requires' lists stages whose output it reads,
+    'sources' the SOURCES it downloads and 'outputs' the properties it writes.
+
+    A parallel stage never sees the features: it is called as func(options),
+    possibly in a worker process, and returns a StageTable that the parent
+    joins onto the features (or False when there is nothing new).
+    """
+    def register(func):
+        STAGES[name] = Stage(name, func, tuple(requires), tuple(sources), tuple(outputs), parallel)
+        return func
+    return register
+
+
+def output_properties():
+    """
+    Return every property written by a registered stage, in stage order.
+    """
+    return [name for registered in STAGES.values() for name in registered.outputs]
+
+
+def is_applied(name, inputs, options):
+    """
+    Return True when the features already hold what stage 'name' computes
+    from 'inputs' (and --force is off).
+
+    A 304 from the server only says the download is unchanged; the copy
+    may have been downloaded by another stage, or by a run that failed
+    before it saved its results, so the stages compare source hashes.
+    """
+    return not options['force'] and (options.get('applied') or {}).get(name) == inputs
+
+
+def target_month(current_date):
+    """
+    Return the last day of the month the monthly data should be read for.
+
+    Before the 15th of the month the previous month has usually not been
+    published yet, so we fall back to two months ago.
+    """
+    last_month_end = current_date.replace(day=1) - timedelta(days=1)
+    if current_date.day < 15:
+        return last_month_end.replace(day=1) - timedelta(days=1)
+    return last_month_end
+
+
+def download_csv(name, options):
+    """
+    Return the fetch.FetchResult for a source, waiting for the run's
+    FetchScheduler or downloading it directly when there is none.
+    """
+    # Worker processes get the results the parent already waited for
+    fetched = options.get('fetched') or {}
+    if name in fetched:
+        return fetched[name]
+
+    downloads = options.get('downloads')
+    if downloads is not None:
+        downloads.submit(SOURCES[name])
+        return downloads.result(name)
+
+    source = SOURCES[name]
+    return fetch.fetch_with_retries(source.url, os.path.join(options['download_dir'], source.file_name),
+                                    force=options['force'])
+
+
+def join_fips(geojson_data, table, metrics, nest=None):
+    """
+    Join 'metrics' from a table with an integer 'fips' column onto the
+    features by their crosswalk key. Returns the number of features matched.
+    """
+    table = table[table['fips'] != crosswalk.MISSING]
+    return join_keyed(geojson_data, crosswalk.feature_keys(geojson_data), table, 'fips', metrics, nest=nest)
+
+
+def merge_table(geojson_data, result, record=None):
+    """
+    Join the StageTable a parallel stage returned onto the features.
+    Returns False when the stage had nothing new.
+
+    With 'record' (an instrument step), the rows in, rows matched and the
+    nulls per output property are added to it.
+    """
+    if result is False or result is None:
+        return False
+    matched = join_fips(geojson_data, result.table, result.metrics, nest=result.nest)
+    if record is not None:
+        record['rows_in'] = len(result.table)
+        record['rows_matched'] = matched
+        record['nulls'] = instrument.null_counts(
+            geojson_data, [metric.property for metric in result.metrics], result.nest)
+    return True
+
+
+@stage('county_names', outputs=('CountyName',))
+def add_county_names(geojson_data, options):
+    """
+    Build the CountyName property ("Autauga County, AL") from
+    CountyNamesBase_NAMECOUNTY and LSAD.
+    """
+    features = geojson_data['features']
+    with instrument.step(options, 'county_names', 'join', rows_in=len(features)) as record:
+        named = 0
+        for feature in features:
+            properties = feature['properties']
+
+            # Extract the necessary values from the properties
+            county_name_base = properties.get('CountyNamesBase_NAMECOUNTY')
+            lsad = properties.get('LSAD')
+
+            if county_name_base is not None and lsad is not None:
+                # Split the county name base into county name and state
+                county_name, state = county_name_base.split(', ')
+                properties['CountyName'] = f"{county_name} {lsad}, {state}"
+                named += 1
+            else:
+                logging.warning("Skipping feature with missing properties: %s", properties)
+        record['rows_matched'] = named
+        record['nulls'] = {'CountyName': len(features) - named}
+
+
+def read_inventory(path):
+    # UTF-16 TSV with one row per county and one column per month
+    return pd.read_csv(path, sep='\t', encoding='utf-16', thousands=',')
+
+
+@stage('inventory', requires=('county_names',), outputs=('HousingInventory',), parallel=True)
+def add_housing_inventory(options):
+    """
+    Return the HousingInventory table from inventory.csv, matching its
+    county names through the crosswalk.
+    """
+    # inventory.csv labels its columns by month name, e.g. "March 2024"
+    inventory_header = target_month(options['today']).strftime('%B %Y')
+
+    with instrument.step(options, 'inventory', 'parse') as record:
+        entry = cache.ensure_entry(options['inventory_path'], read_inventory, 'inventory-v1', options['cache_dir'])
+        if inventory_header in cache.entry_columns(entry):
+            df = cache.load(entry, ['Region', inventory_header])
+        else:
+            logging.warning("inventory.csv has no column for %s", inventory_header)
+            df = pd.DataFrame({'Region': [], inventory_header: []})
+        record['rows_in'] = len(df)
+
+    df['fips'] = options['crosswalk'].keys_for_names(df['Region'], 'inventory')
+    return StageTable(df[['fips', inventory_header]], [Metric('HousingInventory', inventory_header, decimals=0)], None)
+
+
+def _zillow_metrics(stage_name, csv_path, options, value_property, prefix):
+    """
+    Return the table for a Zillow county series (value, YoY and MoM
+    growth) keyed by the state and county FIPS codes.
+    """
+    column_date = target_month(options['today'])
+    column_name = column_date.strftime('%Y-%m-%d')
+    prev_year_column_name = column_date.replace(year=column_date.year - 1).strftime('%Y-%m-%d')
+    prev_month_column_name = (column_date.replace(day=1) - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    with instrument.step(options, stage_name, 'parse') as record:
+        df = cache.read_table(
+            csv_path, pd.read_csv, 'zillow-v1', cache_dir=options['cache_dir'],
+            columns=['StateCodeFIPS', 'MunicipalCodeFIPS', column_name, prev_year_column_name, prev_month_column_name],
+        )
+        record['rows_in'] = len(df)
+
+    # Convert the columns to numeric, replacing non-numeric values with NaN
+    current = pd.to_numeric(df[column_name], errors='coerce')
+    prev_year = pd.to_numeric(df[prev_year_column_name], errors='coerce')
+    prev_month = pd.to_numeric(df[prev_month_column_name], errors='coerce')
+
+    table = pd.DataFrame({
+        'fips': crosswalk.fips_from_parts(df['StateCodeFIPS'], df['MunicipalCodeFIPS']),
+        'value': current,
+        'growthYoY': ((current - prev_year) / prev_year) * 100,
+        'growthMoM': ((current - prev_month) / prev_month) * 100,
+    })
+
+    # Prices are published without decimals, growth rates with two
+    return StageTable(table, [
+        Metric(value_property, 'value', decimals=0),
+        Metric(f'{prefix}growthYoY', 'growthYoY', decimals=2),
+        Metric(f'{prefix}growthMoM', 'growthMoM', decimals=2),
+    ], None)
+
+
+@stage('home_prices', sources=('home_prices',),
+       outputs=('HomePrices', 'homegrowthYoY', 'homegrowthMoM'), parallel=True)
+def add_home_prices(options):
+    """
+    Download the Zillow ZHVI county file and return HomePrices,
+    homegrowthYoY and homegrowthMoM.
+    """
+    path = download_csv('home_prices', options).path
+    inputs = {'home_prices': cache.file_hash(path), 'month': target_month(options['today']).isoformat()}
+    if is_applied('home_prices', inputs, options):
+        logging.info("home_prices.csv already applied for this month, keeping the current HomePrices values")
+        return False
+    return _zillow_metrics('home_prices', path, options, 'HomePrices', 'home')._replace(inputs=inputs)
+
+
+@stage('rent_prices', sources=('rent_prices',),
+       outputs=('RentPrices', 'rentgrowthYoY', 'rentgrowthMoM'), parallel=True)
+def add_rent_prices(options):
+    """
+    Download the Zillow ZORI county file and return RentPrices,
+    rentgrowthYoY and rentgrowthMoM.
+    """
+    path = download_csv('rent_prices', options).path
+    inputs = {'rent_prices': cache.file_hash(path), 'month': target_month(options['today']).isoformat()}
+    if is_applied('rent_prices', inputs, options):
+        logging.info("rent_prices.csv already applied for this month, keeping the current RentPrices values")
+        return False
+    return _zillow_metrics('rent_prices', path, options, 'RentPrices', 'rent')._replace(inputs=inputs)
+
+
+# Census DHC table P9 (Hispanic or Latino, and not Hispanic or Latino by race)
+DEMOGRAPHICS_PATH = os.path.join('DECENNIALDHC2020.P9_2024-12-27T012004', 'DECENNIALDHC2020.P9-Data.csv')
+
+P9_TOTAL = 'P9_001N'
+P9_WHITE = 'P9_005N'
+
+# Hispanic or Latino, the six single races and two or more races (all not Hispanic)
+P9_GROUPS = ['P9_002N', 'P9_005N', 'P9_006N', 'P9_007N', 'P9_008N', 'P9_009N', 'P9_010N', 'P9_011N']
+
+
+def metadata_path(data_path):
+    return data_path.replace('-Data.csv', '-Column-Metadata.csv')
+
+
+def p9_field_names(data_path):
+    """
+    Map P9 column ids to field names built from the last part of their
+    label in the column metadata, e.g. P9_006N -> 'black_or_african_american_alone'.
+    """
+    labels = pd.read_csv(metadata_path(data_path), index_col='Column Name')['Label']
+    names = labels.str.split('!!').str[-1].str.strip(' :').str.lower()
+    return names.str.replace(r'[^a-z0-9]+', '_', regex=True).str.strip('_').to_dict()
+
+
+def read_demographics(path):
+    # The second row repeats the column labels
+    return pd.read_csv(path, usecols=['GEO_ID', P9_TOTAL] + P9_GROUPS, skiprows=[1], dtype={'GEO_ID': str})
+
+
+@stage('demographics', outputs=('demographics',), parallel=True)
+def add_demographics(options):
+    """
+    Return the 'demographics' property with the total population and the
+    share of every P9 race/ethnicity group from the 2020 census, joined
+    on GEO_ID. white_population / white_percentage are not Hispanic,
+    White alone.
+    """
+    with instrument.step(options, 'demographics', 'parse') as record:
+        df = cache.read_table(options['demographics_path'], read_demographics, 'p9-v1',
+                              cache_dir=options['cache_dir'])
+        names = p9_field_names(options['demographics_path'])
+        record['rows_in'] = len(df)
+    # Keep the white_* field names the page already reads
+    names[P9_WHITE] = 'white'
+
+    counts = df[[P9_TOTAL] + P9_GROUPS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    total = counts[:, :1]
+    # Every share in one step; empty counties get no share instead of a division by zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shares = np.where(total > 0, counts[:, 1:] / total * 100, np.nan)
+
+    table = pd.DataFrame(shares, columns=[f"{names[column]}_percentage" for column in P9_GROUPS])
+    table['fips'] = crosswalk.fips_from_ids(df['GEO_ID'])
+    table['total_population'] = counts[:, 0]
+    table['white_population'] = counts[:, 1 + P9_GROUPS.index(P9_WHITE)]
+
+    metrics = [
+        Metric("total_population", "total_population", decimals=0),
+        Metric("white_population", "white_population", decimals=0),
+    ]
+    metrics += [Metric(column, column, decimals=2) for column in table.columns if column.endswith('_percentage')]
+    return StageTable(table, metrics, "demographics")
+
+
+@stage('timeseries', requires=('county_names',), sources=('home_prices', 'rent_prices'))
+def write_timeseries(geojson_data, options):
+    """
+    Write the per-county home, rent and inventory history used by the
+    chart and the month x county growth cube (see timeseries.py). Leaves
+    the features untouched.
+    """
+    if not options['publish_dir']:
+        return False
+
+    tables = {}
+    with instrument.step(options, 'timeseries', 'parse') as record:
+        for metric in ('home', 'rent'):
+            path = download_csv(f'{metric}_prices', options).path
+            tables[metric] = timeseries.zillow_wide(cache.read_table(path, pd.read_csv, 'zillow-v1',
+                                                                     cache_dir=options['cache_dir']))
+        inventory = cache.read_table(options['inventory_path'], read_inventory, 'inventory-v1',
+                                     cache_dir=options['cache_dir'])
+        keys = options['crosswalk'].keys_for_names(inventory['Region'], 'inventory')
+        tables['inventory'] = timeseries.inventory_wide(inventory, keys)
+        record['rows_in'] = sum(len(ids) for ids, _, _ in tables.values())
+
+    with instrument.step(options, 'timeseries', 'write'):
+        timeseries.build_store(tables, options['publish_dir'])
+        timeseries.build_cube(tables, options['publish_dir'])
+    return False
@@ -0,0 +1,86 @@
+"""
+classify.py class breaks on awkward data: equal values, ties, outliers
+and missing values.
+"""
+import numpy as np
+import pytest
+
+import classify
+
+
+def check_classes(values, breaks):
+    index = classify.class_index(values, breaks)
+    known = index[~np.isnan(index)]
+    assert known.min() >= 0 and known.max() <= len(breaks) - 2
+    return index
+
+
+@pytest.mark.parametrize('method', classify.METHODS)
+def test_all_equal_values_give_one_class(method):
+    values = np.full(50, 120000.0)
+
+    breaks = classify.breaks_for(values, method)
+
+    assert breaks.tolist() == [120000.0, 120000.0]
+    assert check_classes(values, breaks).tolist() == [0.0] * 50
+
+
+@pytest.mark.parametrize('method', classify.METHODS)
+def test_ties_merge_classes(method):
+    values = np.array([1.0] * 60 + [2.0] * 25 + [3.0] * 15)
+
+    breaks = classify.breaks_for(values, method)
+
+    # Three distinct values cannot fill seven classes
+    assert len(breaks) - 1 <= 3
+    assert np.all(np.diff(breaks[:-1]) > 0)
+    index = check_classes(values, breaks)
+    # Equal values always land in the same class
+    for value in (1.0, 2.0, 3.0):
+        assert len(set(index[values == value].tolist())) == 1
+
+
+def test_outlier_keeps_a_class_of_its_own():
+    values = np.concatenate([np.arange(1, 100, dtype=float), [1000.0]])
+
+    breaks = classify.breaks_for(values, 'jenks')
+
+    assert breaks[-2] == breaks[-1] == 1000.0
+    index = check_classes(values, breaks)
+    top = len(breaks) - 2
+    assert index[-1] == top
+    assert np.all(index[:-1] < top)
+
+
+def test_nan_stays_nan():
+    values = np.array([1.0, np.nan, 3.0, 5.0, np.nan, 9.0])
+
+    breaks = classify.breaks_for(values, 'quantile', classes=2)
+    index = classify.class_index(values, breaks)
+
+    assert np.isnan(index[[1, 4]]).all()
+    assert not np.isnan(index[[0, 2, 3, 5]]).any()
+
+
+def test_no_values_give_no_breaks():
+    assert classify.breaks_for(np.array([np.nan, np.nan]), 'quantile').tolist() == []
+
+
+def test_classify_writes_null_for_missing_values():
+    homes = [200000, None, 300000, 'n/a', 400000]
+    rents = [1000, 1200, None, 1500, 2000]
+    geojson_data = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'HomePrices': home, 'RentPrices': rent}, 'geometry': None}
+        for home, rent in zip(homes, rents)]}
+
+    classes = classify.classify(geojson_data)
+
+    properties = [item['properties'] for item in geojson_data['features']]
+    assert [p['HomePrices_class'] is None for p in properties] == [False, True, False, True, False]
+    assert [p['rentalYield'] is None for p in properties] == [False, True, True, True, False]
+    assert properties[0]['rentalYield'] == 6.0
+    assert classes['HomePrices']['nulls'] == 2
+    assert sum(classes['HomePrices']['counts']) == 3
+    # A metric nobody has gets no breaks and only nulls
+    assert classes['HousingInventory']['breaks'] == []
+    assert all(p['HousingInventory_class'] is None for p in properties)
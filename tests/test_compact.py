@@ -0,0 +1,141 @@
+"""
+compact.py shared-arc topology: junctions, de-duplicated arcs, the
+TopoJSON round trip and simplification that keeps every ring.
+"""
+import math
+
+import numpy as np
+
+import compact
+
+
+def square(x, y, size=1.0):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def circle(x, y, radius, points=48):
+    ring = [[x + radius * math.cos(2 * math.pi * i / points), y + radius * math.sin(2 * math.pi * i / points)]
+            for i in range(points)]
+    return ring + ring[:1]
+
+
+def feature(geometry_type, coordinates, **properties):
+    return {'type': 'Feature', 'properties': properties,
+            'geometry': {'type': geometry_type, 'coordinates': coordinates}}
+
+
+def collection(*features):
+    return {'type': 'FeatureCollection', 'features': list(features)}
+
+
+def topology_of(geojson_data):
+    polygons = compact.map_rings([item['geometry'] for item in geojson_data['features']], compact.clean_ring)
+    return compact.build_topology(polygons)
+
+
+def arc_ids(geometry_refs):
+    return [index for polygon_refs in geometry_refs for ring_refs in polygon_refs for index in ring_refs]
+
+
+def test_shared_edge_is_stored_once():
+    left = feature('Polygon', [square(0, 0)])
+    right = feature('Polygon', [square(1, 0)])
+
+    arcs, references = topology_of(collection(left, right))
+
+    # The common border plus the rest of each square
+    assert len(arcs) == 3
+    left_ids, right_ids = arc_ids(references[0]), arc_ids(references[1])
+    shared = {index if index >= 0 else ~index for index in left_ids} & \
+             {index if index >= 0 else ~index for index in right_ids}
+    assert len(shared) == 1
+    arc = shared.pop()
+    assert arcs[arc].tolist() in ([[1, 0], [1, 1]], [[1, 1], [1, 0]])
+    # Walked in opposite directions by the two neighbours
+    assert (arc in left_ids) != (arc in right_ids)
+
+
+def test_hole_shares_the_ring_of_the_county_inside_it():
+    # Reversed orientation, as a hole is usually wound
+    hole = square(1, 1)[::-1]
+    outer = feature('Polygon', [square(0, 0, 3), hole])
+    island = feature('Polygon', [square(1, 1)])
+
+    arcs, references = topology_of(collection(outer, island))
+
+    assert len(arcs) == 2
+    hole_ref = references[0][0][1]
+    island_ref = references[1][0][0]
+    assert len(hole_ref) == len(island_ref) == 1
+    assert hole_ref[0] in (island_ref[0], ~island_ref[0])
+
+
+def test_multipolygon_round_trip():
+    parts = feature('MultiPolygon', [[square(0, 0)], [square(5, 5, 2)]], GEO_ID='a')
+    neighbour = feature('Polygon', [square(1, 0)], GEO_ID='b')
+
+    decoded = compact.from_topojson(compact.to_topojson(collection(parts, neighbour), quantization=1000))
+
+    geometry = decoded['features'][0]['geometry']
+    assert geometry['type'] == 'MultiPolygon'
+    assert len(geometry['coordinates']) == 2
+    assert decoded['features'][0]['properties'] == {'GEO_ID': 'a'}
+    assert decoded['features'][1]['geometry']['type'] == 'Polygon'
+
+
+def test_encode_decode_within_quantization():
+    source = collection(
+        feature('Polygon', [circle(0, 0, 1)]),
+        feature('Polygon', [square(1, -0.5)]),
+        feature('MultiPolygon', [[square(3, 3)], [circle(6, 6, 0.5, 12)]]),
+    )
+    quantization = 10000
+
+    topology = compact.to_topojson(source, quantization=quantization)
+    decoded = compact.from_topojson(topology)
+    tolerance = max(topology['transform']['scale'])
+
+    for original, result in zip(source['features'], decoded['features']):
+        original_rings = [ring for polygon in compact.polygons_of(original['geometry']) for ring in polygon]
+        result_rings = [ring for polygon in compact.polygons_of(result['geometry']) for ring in polygon]
+        assert len(result_rings) == len(original_rings)
+        for ring, decoded_ring in zip(original_rings, result_rings):
+            ring, decoded_ring = np.asarray(ring), np.asarray(decoded_ring)
+            assert decoded_ring[0].tolist() == decoded_ring[-1].tolist()
+            # Rings may start at another point; every point must still be there
+            assert len(decoded_ring) == len(ring)
+            distances = np.hypot(*(ring[:, None, :] - decoded_ring[None, :, :]).transpose(2, 0, 1))
+            assert distances.min(axis=1).max() <= tolerance
+
+
+def test_simplify_keeps_every_ring():
+    source = collection(
+        feature('Polygon', [circle(0, 0, 1)]),
+        feature('Polygon', [square(1, -0.5)]),
+        feature('Polygon', [square(-1, -1, 0.01)]),
+        feature('MultiPolygon', [[square(3, 3)], [circle(6, 6, 0.5, 12)]]),
+    )
+    arcs, references = topology_of(source)
+
+    # A tolerance far larger than any county
+    simplified = compact.simplify_arcs(arcs, references, tolerance=100.0)
+
+    for geometry_refs in references:
+        for polygon_refs in geometry_refs:
+            for ring_refs in polygon_refs:
+                ring = compact.decode_ring(simplified, ring_refs)
+                assert len(ring) >= 4
+                assert ring[0].tolist() == ring[-1].tolist()
+
+
+def test_simplified_topojson_keeps_every_ring():
+    source = collection(
+        feature('Polygon', [circle(0, 0, 1, 200)]),
+        feature('Polygon', [square(1, -0.5)]),
+    )
+
+    decoded = compact.from_topojson(compact.to_topojson(source, simplify=5.0))
+
+    for item in decoded['features']:
+        for polygon in compact.polygons_of(item['geometry']):
+            assert polygon and all(len(ring) >= 4 for ring in polygon)
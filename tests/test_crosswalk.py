@@ -0,0 +1,12 @@
+"""
+crosswalk.py name matching.
+"""
+import crosswalk
+
+
+def test_blank_names_are_unmatched_but_not_listed():
+    index = crosswalk.Crosswalk(names={'autauga county, al': 1001})
+
+    keys = index.keys_for_names(['Autauga County, AL', None, '', 'Nowhere County, ZZ'], 'inventory')
+    assert keys.tolist() == [1001, crosswalk.MISSING, crosswalk.MISSING, crosswalk.MISSING]
+    assert index.report['inventory']['unmatched'] == ['Nowhere County, ZZ']
@@ -0,0 +1,138 @@
+"""
+fetch.py against a local http.server: conditional requests, retries and
+interrupted downloads.
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import fetch
+
+BODY = b'RegionID,SizeRank\n1,0\n' * 100
+ETAG = '"v1"'
+LAST_MODIFIED = 'Wed, 15 May 2024 10:00:00 GMT'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Answers from server.responses, one per request (the last one repeats),
+    and keeps the headers of every request in server.requests.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        responses = self.server.responses
+        response = responses.pop(0) if len(responses) > 1 else responses[0]
+        response(self)
+
+    def log_message(self, *args):
+        pass
+
+
+def ok(handler):
+    if handler.headers.get('If-None-Match') == ETAG:
+        handler.send_response(304)
+        handler.end_headers()
+        return
+    handler.send_response(200)
+    handler.send_header('ETag', ETAG)
+    handler.send_header('Last-Modified', LAST_MODIFIED)
+    handler.send_header('Content-Length', str(len(BODY)))
+    handler.end_headers()
+    handler.wfile.write(BODY)
+
+
+def unavailable(handler):
+    handler.send_response(503)
+    handler.send_header('Content-Length', '0')
+    handler.end_headers()
+
+
+def truncated(handler):
+    # Promise the whole body, send half of it and hang up
+    handler.send_response(200)
+    handler.send_header('ETag', '"v2"')
+    handler.send_header('Content-Length', str(len(BODY)))
+    handler.end_headers()
+    handler.wfile.write(BODY[:len(BODY) // 2])
+    handler.wfile.flush()
+    handler.close_connection = True
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.requests = []
+    httpd.responses = [ok]
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/County_zhvi.csv"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def temporary_files(directory):
+    return [name for name in os.listdir(directory) if name.startswith('.tmp-')]
+
+
+def test_second_fetch_is_conditional(server, tmp_path):
+    path = str(tmp_path / 'home_prices.csv')
+
+    first = fetch.fetch(server.url, path)
+    assert first.changed
+    with open(path, 'rb') as file:
+        assert file.read() == BODY
+    assert fetch.load_meta(path) == {'url': server.url, 'etag': ETAG, 'last_modified': LAST_MODIFIED}
+
+    second = fetch.fetch(server.url, path)
+    assert not second.changed
+    assert server.requests[1]['If-None-Match'] == ETAG
+    assert server.requests[1]['If-Modified-Since'] == LAST_MODIFIED
+    with open(path, 'rb') as file:
+        assert file.read() == BODY
+
+
+def test_force_sends_no_validators(server, tmp_path):
+    path = str(tmp_path / 'home_prices.csv')
+    fetch.fetch(server.url, path)
+
+    assert fetch.fetch(server.url, path, force=True).changed
+    assert 'If-None-Match' not in server.requests[1]
+
+
+def test_retries_server_errors(server, tmp_path):
+    path = str(tmp_path / 'home_prices.csv')
+    server.responses = [unavailable, unavailable, ok]
+
+    result = fetch.fetch_with_retries(server.url, path, retries=3, backoff=0)
+    assert result.changed
+    assert len(server.requests) == 3
+    with open(path, 'rb') as file:
+        assert file.read() == BODY
+
+
+def test_gives_up_after_the_last_retry(server, tmp_path):
+    path = str(tmp_path / 'home_prices.csv')
+    server.responses = [unavailable]
+
+    with pytest.raises(requests.HTTPError):
+        fetch.fetch_with_retries(server.url, path, retries=2, backoff=0)
+    assert len(server.requests) == 2
+    assert not os.path.exists(path)
+
+
+def test_interrupted_download_keeps_the_previous_copy(server, tmp_path):
+    path = str(tmp_path / 'home_prices.csv')
+    fetch.fetch(server.url, path)
+    server.responses = [truncated]
+
+    with pytest.raises(requests.RequestException):
+        fetch.fetch(server.url, path, force=True)
+    with open(path, 'rb') as file:
+        assert file.read() == BODY
+    assert fetch.load_meta(path)['etag'] == ETAG
+    assert temporary_files(str(tmp_path)) == []
@@ -0,0 +1,79 @@
+// Show the GeoJSON tile pyramid written by tiles.py in a Leaflet GeoJSON
+// layer, fetching only the tiles in view. Tiles beyond the pyramid's zoom
+// range are taken from its nearest level; each county (tiles.json 'key')
+// is added once per level, and the layer is refilled when the level changes.
+// Tiles only carry geometry: the columns of 'attributes' (attributes.json,
+// see snapshot.js) are joined onto every tile as it arrives.
+function loadTiles(map, layer, baseUrl, attributes) {
+    var tileCache = {};
+    var added = {};
+    var level = null;
+    var info = null;
+
+    function tileRange(zoom) {
+        var bounds = map.getBounds();
+        var n = Math.pow(2, zoom);
+        function tileX(lng) {
+            return Math.min(n - 1, Math.max(0, Math.floor((lng + 180) / 360 * n)));
+        }
+        function tileY(lat) {
+            lat = Math.max(-85.0511, Math.min(85.0511, lat)) * Math.PI / 180;
+            var y = (1 - Math.log(Math.tan(lat) + 1 / Math.cos(lat)) / Math.PI) / 2 * n;
+            return Math.min(n - 1, Math.max(0, Math.floor(y)));
+        }
+        return {
+            x0: tileX(bounds.getWest()), x1: tileX(bounds.getEast()),
+            y0: tileY(bounds.getNorth()), y1: tileY(bounds.getSouth())
+        };
+    }
+
+    function fetchTile(zoom, x, y) {
+        var url = baseUrl + zoom + '/' + x + '/' + y + '.json';
+        if (!(url in tileCache)) {
+            tileCache[url] = fetch(url).then(function (response) {
+                // Tiles without any county are not written
+                return response.ok ? response.json() : { type: 'FeatureCollection', features: [] };
+            }).then(function (tile) {
+                return joinAttributes(tile, attributes);
+            });
+        }
+        return tileCache[url];
+    }
+
+    function update() {
+        var zoom = Math.max(info.minzoom, Math.min(info.maxzoom, Math.round(map.getZoom())));
+        if (zoom !== level) {
+            level = zoom;
+            added = {};
+            layer.clearLayers();
+        }
+
+        var range = tileRange(zoom);
+        for (var x = range.x0; x <= range.x1; x++) {
+            for (var y = range.y0; y <= range.y1; y++) {
+                fetchTile(zoom, x, y).then(function (tile) {
+                    if (zoom !== level) {
+                        return;
+                    }
+                    var features = tile.features.filter(function (feature) {
+                        var id = feature.properties[info.key];
+                        if (added[id]) {
+                            return false;
+                        }
+                        added[id] = true;
+                        return true;
+                    });
+                    layer.addData(features);
+                });
+            }
+        }
+    }
+
+    return fetch(baseUrl + 'tiles.json')
+        .then(function (response) { return response.json(); })
+        .then(function (tilesInfo) {
+            info = tilesInfo;
+            map.on('moveend', update);
+            update();
+        });
+}
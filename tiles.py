@@ -0,0 +1,152 @@
+"""
+Static pyramid of GeoJSON vector tiles for the choropleth.
+
+For every zoom level between MIN_ZOOM and MAX_ZOOM the county borders are
+simplified to roughly one screen pixel (on the shared arcs from compact.py,
+so neighbours still meet) and each county is written into every web
+mercator tile its bounding box touches:
+
+    data/tiles/<name>/tiles.json          zoom range and feature key
+    data/tiles/<name>/{z}/{x}/{y}.json    minified FeatureCollection
+
+Tiles hold the geometry only: the feature key and the properties that do
+not change between refreshes, as in the published geometry file. <name>
+comes from that file's content hash and the zoom range, so the pyramid is
+cut once per geometry and browsers can cache it for good; publish.py
+names it in attributes.json, and tiles.js joins the monthly attributes
+onto every tile it loads.
+
+Features are not clipped to the tile, so a county spanning several tiles
+appears in each of them; tiles.js adds each GEO_ID only once per zoom.
+"""
+import json
+import logging
+import math
+import os
+import shutil
+
+import numpy as np
+
+import compact
+
+MIN_ZOOM = 3
+MAX_ZOOM = 8
+TILE_SIZE = 256
+
+TILES_DIR = 'tiles'
+
+
+def tile_range(bbox, zoom):
+    """
+    Return (x0, y0, x1, y1), the inclusive range of tiles at 'zoom'
+    covering a lon/lat bounding box.
+    """
+    def to_tile(lon, lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        n = 2 ** zoom
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    x0, y0 = to_tile(min_lon, max_lat)
+    x1, y1 = to_tile(max_lon, min_lat)
+    return x0, y0, x1, y1
+
+
+def pixel_degrees(zoom):
+    """
+    Return the width of one screen pixel in degrees of longitude at 'zoom'.
+    """
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def zoom_precision(zoom):
+    """
+    Return the number of decimals that still resolves a tenth of a pixel.
+    """
+    return max(0, math.ceil(-math.log10(pixel_degrees(zoom) / 10)))
+
+
+def pyramid_name(digest, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """
+    Return the directory name of the pyramid for a geometry file content hash.
+    """
+    return f"{digest}-z{min_zoom}-{max_zoom}"
+
+
+def remove_old_pyramids(out_dir, keep):
+    """
+    Remove everything under out_dir/tiles except the pyramid named 'keep'.
+    """
+    tiles_dir = os.path.join(out_dir, TILES_DIR)
+    for name in os.listdir(tiles_dir):
+        if name == keep:
+            continue
+        path = os.path.join(tiles_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+def write_tiles(geometry_data, out_dir, name, key='GEO_ID', min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """
+    Cut the features, with the properties they have, into tiles under
+    out_dir/tiles/<name>. Returns the number of tiles written per zoom level.
+    """
+    features = geometry_data['features']
+
+    polygons = compact.map_rings([feature['geometry'] for feature in features], compact.clean_ring)
+    arcs, references = compact.build_topology(polygons)
+
+    bboxes = []
+    for geometry_polygons in polygons:
+        points = np.vstack([ring for polygon in geometry_polygons for ring in polygon]) if geometry_polygons else None
+        bboxes.append(None if points is None else (*points.min(axis=0), *points.max(axis=0)))
+
+    # Build the pyramid in a temporary directory and rename it into place at the end
+    pyramid_dir = os.path.join(out_dir, TILES_DIR, name)
+    tmp_dir = os.path.join(out_dir, TILES_DIR, f".tmp-{name}-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    counts = {}
+    for zoom in range(min_zoom, max_zoom + 1):
+        simplified = compact.simplify_arcs(arcs, references, pixel_degrees(zoom))
+        precision = zoom_precision(zoom)
+
+        tiles = {}
+        for index, (geometry_refs, bbox) in enumerate(zip(references, bboxes)):
+            if bbox is None:
+                continue
+            coordinates = [[np.round(compact.decode_ring(simplified, ring_refs), precision).tolist()
+                            for ring_refs in polygon_refs] for polygon_refs in geometry_refs]
+            feature = {'type': 'Feature', 'properties': features[index]['properties'],
+                       'geometry': compact.as_geometry(coordinates)}
+
+            x0, y0, x1, y1 = tile_range(bbox, zoom)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    tiles.setdefault((x, y), []).append(feature)
+
+        for (x, y), tile_features in tiles.items():
+            tile_dir = os.path.join(tmp_dir, str(zoom), str(x))
+            os.makedirs(tile_dir, exist_ok=True)
+            with open(os.path.join(tile_dir, f"{y}.json"), 'w', encoding='utf-8') as file:
+                json.dump({'type': 'FeatureCollection', 'features': tile_features}, file,
+                          separators=compact.COMPACT, ensure_ascii=False)
+        counts[zoom] = len(tiles)
+        logging.info("Zoom %d: %d tiles", zoom, len(tiles))
+
+    with open(os.path.join(tmp_dir, 'tiles.json'), 'w', encoding='utf-8') as file:
+        json.dump({'minzoom': min_zoom, 'maxzoom': max_zoom, 'key': key}, file, separators=compact.COMPACT)
+
+    try:
+        os.replace(tmp_dir, pyramid_dir)
+    except OSError:
+        # Another run cut the same pyramid first
+        if not os.path.isdir(pyramid_dir):
+            raise
+        shutil.rmtree(tmp_dir)
+    return counts
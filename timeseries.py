@@ -0,0 +1,211 @@
+"""
+Indexed per-county time-series store for the price history chart.
+
+Each metric is written as one packed little-endian float32 file holding
+every county's series back to back, trimmed to its first and last known
+month, plus a shared JSON index:
+
+    data/series/index.json
+        {
+          "months": ["2000-01", ...],
+          "ids": ["01001", ...],
+          "metrics": {
+            "home": {"file": "home.f32", "offset": [...], "start": [...], "length": [...]},
+            ...
+          }
+        }
+
+County ids[i]'s home series is length[i] float32 values at element
+offset[i] of home.f32, starting at months[start[i]]; a length of 0 means no
+data. series.js reads one county with an HTTP Range request, so a click
+downloads a few hundred bytes per metric instead of the whole CSV.
+
+build_cube() writes the same sources as a month x county cube of levels
+and month-over-month / year-over-year growth for every month at once, for
+a month selector on the map.
+"""
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import atomic
+import compact
+import crosswalk
+
+SERIES_DIR = 'series'
+CUBE_DIR = 'cube'
+
+ZILLOW_MONTH = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def zillow_wide(df):
+    """
+    Return (ids, months, matrix) for a wide Zillow county table: integer
+    FIPS keys, 'YYYY-MM' month labels and a counties x months float array.
+    """
+    columns = [column for column in df.columns if ZILLOW_MONTH.match(column)]
+    ids = crosswalk.fips_from_parts(df['StateCodeFIPS'], df['MunicipalCodeFIPS'])
+    months = [column[:7] for column in columns]
+    matrix = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    known = ids != crosswalk.MISSING
+    return ids[known], months, matrix[known]
+
+
+def inventory_wide(df, keys):
+    """
+    Return (ids, months, matrix) for the inventory table, whose columns are
+    'March 2024' style month names. 'keys' holds the crosswalk key of each
+    row; rows without a known county are dropped.
+    """
+    columns = [column for column in df.columns if column != 'Region']
+    months = [datetime.strptime(column, '%B %Y').strftime('%Y-%m') for column in columns]
+    known = keys != crosswalk.MISSING
+    matrix = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)[known]
+    return keys[known], months, matrix
+
+
+def align_months(months, matrix, axis):
+    """
+    Reindex a counties x months matrix onto the shared month axis.
+    """
+    positions = {month: i for i, month in enumerate(axis)}
+    aligned = np.full((matrix.shape[0], len(axis)), np.nan)
+    aligned[:, [positions[month] for month in months]] = matrix
+    return aligned
+
+
+def pack(matrix):
+    """
+    Trim every row to its first..last non-NaN value and pack the rows back
+    to back. Returns (values, start, length) with one start/length per row.
+    """
+    valid = ~np.isnan(matrix)
+    has_data = valid.any(axis=1)
+    columns = np.arange(matrix.shape[1])
+
+    first = np.where(has_data, valid.argmax(axis=1), 0)
+    last = np.where(has_data, matrix.shape[1] - 1 - valid[:, ::-1].argmax(axis=1), -1)
+    length = np.where(has_data, last - first + 1, 0)
+
+    # Row-major boolean indexing concatenates the kept slices in row order
+    keep = (columns >= first[:, None]) & (columns <= last[:, None])
+    return matrix[keep].astype('<f4'), first, length
+
+
+def month_axis(months):
+    """
+    Return every 'YYYY-MM' month from the earliest to the latest in months.
+    """
+    periods = pd.PeriodIndex(sorted(set(months)), freq='M')
+    return [str(period) for period in pd.period_range(periods.min(), periods.max(), freq='M')]
+
+
+def stack_tables(tables, axis):
+    """
+    Put every table on one grid. Returns (ids, rows): the sorted integer
+    keys, and per metric a counties x months array in that order, NaN where
+    a source has no value.
+    """
+    ids = np.unique(np.concatenate([county_ids for county_ids, _, _ in tables.values()]))
+    row_of = pd.Index(ids)
+
+    rows = {}
+    for metric, (county_ids, months, matrix) in tables.items():
+        grid = np.full((len(ids), len(axis)), np.nan)
+        grid[row_of.get_indexer(county_ids)] = align_months(months, matrix, axis)
+        rows[metric] = grid
+    return ids, rows
+
+
+def growth(levels, lag):
+    """
+    Return the percent change of every column against the column 'lag'
+    months earlier, for all counties and months at once (NaN when either
+    value is missing or the earlier one is zero).
+    """
+    previous = np.full_like(levels, np.nan)
+    previous[:, lag:] = levels[:, :-lag]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (levels - previous) / previous * 100
+    change[~np.isfinite(change)] = np.nan
+    return change
+
+
+def county_ids(keys):
+    """
+    Format integer keys as the five digit ids the page uses (feature 'id').
+    """
+    return [f"{key:05d}" for key in keys.tolist()]
+
+
+def write_array(values, path):
+    with atomic.open_atomic(path, 'wb') as file:
+        file.write(values.astype('<f4').tobytes())
+
+
+def write_index(index, path):
+    atomic.write_json(index, path, separators=compact.COMPACT)
+
+
+def build_store(tables, out_dir):
+    """
+    Write the store for 'tables', a dict of metric name -> (ids, months,
+    matrix), into out_dir/series. Returns the index.
+    """
+    axis = sorted({month for _, months, _ in tables.values() for month in months})
+    ids, rows = stack_tables(tables, axis)
+
+    series_dir = os.path.join(out_dir, SERIES_DIR)
+    os.makedirs(series_dir, exist_ok=True)
+
+    index = {'months': axis, 'ids': county_ids(ids), 'metrics': {}}
+    for metric, grid in rows.items():
+        values, start, length = pack(grid)
+        offset = np.cumsum(length) - length
+
+        file_name = f"{metric}.f32"
+        write_array(values, os.path.join(series_dir, file_name))
+        index['metrics'][metric] = {
+            'file': file_name,
+            'offset': offset.tolist(),
+            'start': start.tolist(),
+            'length': length.tolist(),
+        }
+
+    write_index(index, os.path.join(series_dir, 'index.json'))
+    return index
+
+
+def build_cube(tables, out_dir):
+    """
+    Write the month x county cube of level, MoM and YoY growth for every
+    metric in 'tables' into out_dir/cube. Returns the index.
+
+    Each measure is a float32 file laid out month by month, so one month of
+    the map is one contiguous slice of len(ids) values:
+
+        data/cube/index.json
+            {"months": ["2012-01", ...], "ids": ["01001", ...],
+             "files": {"home": {"level": "home.level.f32", "mom": ..., "yoy": ...}, ...}}
+    """
+    axis = month_axis([month for _, months, _ in tables.values() for month in months])
+    ids, rows = stack_tables(tables, axis)
+
+    cube_dir = os.path.join(out_dir, CUBE_DIR)
+    os.makedirs(cube_dir, exist_ok=True)
+
+    index = {'months': axis, 'ids': county_ids(ids), 'files': {}}
+    for metric, levels in rows.items():
+        measures = {'level': levels, 'mom': growth(levels, 1), 'yoy': growth(levels, 12)}
+        index['files'][metric] = {}
+        for measure, values in measures.items():
+            file_name = f"{metric}.{measure}.f32"
+            # Transpose to month-major so a month is contiguous
+            write_array(np.ascontiguousarray(values.T), os.path.join(cube_dir, file_name))
+            index['files'][metric][measure] = file_name
+
+    write_index(index, os.path.join(cube_dir, 'index.json'))
+    return index